@@ -0,0 +1,19 @@
+import pytest
+from django.test import override_settings
+
+from core.test_runner import temporary_caches
+
+
+@pytest.fixture(autouse=True, scope='session')
+def temporary_cache(tmp_path_factory):
+    """Кеш тестов во временном каталоге, а не в рабочем файле."""
+    directory = str(tmp_path_factory.mktemp('cache'))
+    with override_settings(CACHES=temporary_caches(directory)):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def inline_thumbnails(settings):
+    """Миниатюры создаются сразу при сохранении поста: фоновый поток
+    не должен писать во временный MEDIA_ROOT, который тест уже удаляет."""
+    settings.THUMBNAIL_WORKERS = 0
@@ -0,0 +1,322 @@
+import math
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (name, value) VALUES
+    ('size', 0), ('entries', 0), ('hits', 0), ('misses', 0),
+    ('evictions', 0);
+CREATE TRIGGER IF NOT EXISTS cache_inserted AFTER INSERT ON cache BEGIN
+    UPDATE meta SET value = value + NEW.size WHERE name = 'size';
+    UPDATE meta SET value = value + 1 WHERE name = 'entries';
+END;
+CREATE TRIGGER IF NOT EXISTS cache_updated AFTER UPDATE OF size ON cache
+BEGIN
+    UPDATE meta SET value = value - OLD.size + NEW.size WHERE name = 'size';
+END;
+CREATE TRIGGER IF NOT EXISTS cache_deleted AFTER DELETE ON cache BEGIN
+    UPDATE meta SET value = value - OLD.size WHERE name = 'size';
+    UPDATE meta SET value = value - 1 WHERE name = 'entries';
+END;
+'''
+
+UPSERT = (
+    'INSERT INTO cache (key, value, size, expires, accessed) '
+    'VALUES (?, ?, ?, ?, ?) '
+    'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+    'size = excluded.size, expires = excluded.expires, '
+    'accessed = excluded.accessed'
+)
+
+# SQLite ограничивает число параметров одного запроса.
+CHUNK_SIZE = 500
+
+
+class SQLiteCache(BaseCache):
+    """Кеш в файле SQLite, общий для всех процессов одного сервера.
+
+    LOCATION — путь к файлу базы. OPTIONS['MAX_SIZE'] ограничивает
+    суммарный размер значений в байтах, OPTIONS['MAX_ENTRIES'] — число
+    записей: при переполнении удаляются давно не читавшиеся записи.
+    Время чтения и статистика попаданий копятся в процессе и
+    записываются одной транзакцией раз в OPTIONS['FLUSH_INTERVAL']
+    секунд.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', 64 * 1024 * 1024))
+        self._max_entries = (
+            int(options['MAX_ENTRIES']) if 'MAX_ENTRIES' in options else None
+        )
+        self._flush_interval = float(options.get('FLUSH_INTERVAL', 1))
+        self._local = threading.local()
+
+    @property
+    def _state(self):
+        state = self._local
+        if getattr(state, 'pid', None) != os.getpid():
+            state.db = self._connect()
+            state.pid = os.getpid()
+            state.accessed = {}
+            state.hits = 0
+            state.misses = 0
+            state.flushed = time.monotonic()
+        return state
+
+    def _connect(self):
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(
+            self._path,
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        db.execute('PRAGMA journal_mode = WAL')
+        db.execute('PRAGMA synchronous = NORMAL')
+        db.executescript(SCHEMA)
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._state.db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        else:
+            db.execute('COMMIT')
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _record(self, hits=(), misses=0):
+        state = self._state
+        now = time.time()
+        state.accessed.update(dict.fromkeys(hits, now))
+        state.hits += len(hits)
+        state.misses += misses
+        if time.monotonic() - state.flushed >= self._flush_interval:
+            self._flush()
+
+    def _flush(self):
+        state = self._state
+        if state.accessed or state.hits or state.misses:
+            with self._transaction() as db:
+                db.executemany(
+                    'UPDATE cache SET accessed = ? WHERE key = ?',
+                    [(accessed, key)
+                     for key, accessed in state.accessed.items()],
+                )
+                db.executemany(
+                    'UPDATE meta SET value = value + ? WHERE name = ?',
+                    [(state.hits, 'hits'), (state.misses, 'misses')],
+                )
+            state.accessed = {}
+            state.hits = 0
+            state.misses = 0
+        state.flushed = time.monotonic()
+
+    def _select(self, keys):
+        """Возвращает неистёкшие значения для ключей одним запросом
+        на каждые CHUNK_SIZE ключей."""
+        db = self._state.db
+        now = time.time()
+        found = {}
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[start:start + CHUNK_SIZE]
+            rows = db.execute(
+                'SELECT key, value FROM cache WHERE key IN (%s) '
+                'AND (expires IS NULL OR expires > ?)'
+                % ', '.join('?' * len(chunk)),
+                [*chunk, now],
+            )
+            found.update(rows)
+        return found
+
+    def _write(self, entries, timeout):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = []
+        for key, value in entries:
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            rows.append((key, blob, len(blob), expires, now))
+        with self._transaction() as db:
+            db.executemany(UPSERT, rows)
+            self._cull(db)
+
+    def _excess(self, db):
+        """Оценивает, сколько записей нужно удалить, чтобы уложиться
+        в MAX_SIZE и MAX_ENTRIES."""
+        size, entries = db.execute(
+            "SELECT SUM(CASE name WHEN 'size' THEN value END), "
+            "SUM(CASE name WHEN 'entries' THEN value END) "
+            "FROM meta WHERE name IN ('size', 'entries')"
+        ).fetchone()
+        excess = 0
+        if self._max_entries is not None:
+            excess = entries - self._max_entries
+        if size > self._max_size:
+            average = size / max(entries, 1)
+            excess = max(excess, math.ceil((size - self._max_size) / average))
+        return max(excess, 0)
+
+    def _cull(self, db):
+        if not self._excess(db):
+            return
+        db.execute(
+            'DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?',
+            (time.time(),),
+        )
+        excess = self._excess(db)
+        while excess:
+            evicted = db.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                (min(excess, CHUNK_SIZE),),
+            ).rowcount
+            if not evicted:
+                break
+            db.execute(
+                "UPDATE meta SET value = value + ? WHERE name = 'evictions'",
+                (evicted,),
+            )
+            excess = self._excess(db)
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        found = self._select([key])
+        if key not in found:
+            self._record(misses=1)
+            return default
+        self._record(hits=[key])
+        return pickle.loads(found[key])
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        found = self._select(list(keys))
+        self._record(hits=list(found), misses=len(keys) - len(found))
+        return {keys[key]: pickle.loads(value) for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._write([(self._key(key, version), value)], timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self._write(
+            [(self._key(key, version), value) for key, value in data.items()],
+            timeout,
+        )
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self._transaction() as db:
+            added = db.execute(
+                UPSERT + ' WHERE cache.expires IS NOT NULL '
+                'AND cache.expires <= ?',
+                (key, blob, len(blob), self.get_backend_timeout(timeout),
+                 now, now),
+            ).rowcount
+            self._cull(db)
+        return added > 0
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._transaction() as db:
+            return db.execute(
+                'UPDATE cache SET expires = ? WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (self.get_backend_timeout(timeout), key, time.time()),
+            ).rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        """Атомарно изменяет число: чтение и запись идут в одной
+        транзакции с блокировкой записи."""
+        key = self._key(key, version)
+        with self._transaction() as db:
+            row = db.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            db.execute(
+                'UPDATE cache SET value = ?, size = ? WHERE key = ?',
+                (blob, len(blob), key),
+            )
+        return value
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return key in self._select([key])
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        with self._transaction() as db:
+            return db.execute(
+                'DELETE FROM cache WHERE key = ?', (key,)
+            ).rowcount > 0
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        with self._transaction() as db:
+            db.executemany(
+                'DELETE FROM cache WHERE key = ?', [(key,) for key in keys]
+            )
+
+    def clear(self):
+        with self._transaction() as db:
+            db.execute('DELETE FROM cache')
+
+    def iter_keys(self, prefix='', version=None):
+        """Перебирает ключи, начинающиеся с prefix, без KEY_PREFIX
+        и версии."""
+        full_prefix = self.make_key(prefix, version=version)
+        stem = len(full_prefix) - len(prefix)
+        rows = self._state.db.execute(
+            'SELECT key FROM cache WHERE substr(key, 1, ?) = ?',
+            (len(full_prefix), full_prefix),
+        )
+        for (key,) in rows:
+            yield key[stem:]
+
+    def get_stats(self):
+        """Возвращает попадания, промахи, вытеснения, число записей и
+        их суммарный размер в байтах."""
+        self._flush()
+        return dict(self._state.db.execute('SELECT name, value FROM meta'))
+
+    def close(self, **kwargs):
+        if time.monotonic() - self._state.flushed >= self._flush_interval:
+            self._flush()
@@ -0,0 +1,40 @@
+from django.core.cache import caches
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.images import deserialize_image_file
+from sorl.thumbnail.kvstores.base import KVStoreBase, add_prefix
+
+
+class KVStore(KVStoreBase):
+    """Хранилище sorl-thumbnail целиком в кеше THUMBNAIL_CACHE.
+
+    Рассчитано на постоянный общий кеш вроде SQLiteCache. Вытесненная
+    запись не теряет миниатюру: sorl заново проверит файл в хранилище
+    и запишет ключ обратно.
+    """
+
+    @property
+    def cache(self):
+        return caches[settings.THUMBNAIL_CACHE]
+
+    def _get_raw(self, key):
+        return self.cache.get(key)
+
+    def _set_raw(self, key, value):
+        self.cache.set(key, value, settings.THUMBNAIL_CACHE_TIMEOUT)
+
+    def _delete_raw(self, *keys):
+        self.cache.delete_many(keys)
+
+    def _find_keys_raw(self, prefix):
+        return list(self.cache.iter_keys(prefix))
+
+    def get_many(self, image_files):
+        """Возвращает найденные в хранилище миниатюры по их ключам
+        одним запросом к кешу."""
+        keys = {add_prefix(image_file.key): image_file.key
+                for image_file in image_files}
+        found = self.cache.get_many(keys)
+        return {
+            keys[key]: deserialize_image_file(value)
+            for key, value in found.items() if value
+        }
@@ -0,0 +1,59 @@
+import hashlib
+import os
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+DIGEST = re.compile(r'[0-9a-f]{64}')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, которое называет файлы по SHA-256 содержимого.
+
+    Файл posts/photo.jpg сохраняется как posts/ab/cd/abcd….jpg:
+    первые символы хеша раскладывают файлы по вложенным каталогам,
+    а одинаковое содержимое хранится один раз.
+    """
+
+    def __init__(self, *args, shard_levels=2, shard_width=2, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.shard_levels = shard_levels
+        self.shard_width = shard_width
+
+    def content_name(self, name, content):
+        """Возвращает имя файла по содержимому content в каталоге name."""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return '/'.join(
+            [os.path.dirname(name), *self._shards(digest), digest + extension]
+        ).lstrip('/')
+
+    def _shards(self, digest):
+        width = self.shard_width
+        return [digest[level * width:(level + 1) * width]
+                for level in range(self.shard_levels)]
+
+    def is_content_name(self, name):
+        """Проверяет, что имя уже построено по содержимому."""
+        parts = name.split('/')
+        digest = os.path.splitext(parts[-1])[0]
+        if not DIGEST.fullmatch(digest) or len(parts) <= self.shard_levels:
+            return False
+        return parts[-1 - self.shard_levels:-1] == self._shards(digest)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
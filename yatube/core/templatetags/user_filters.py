@@ -6,3 +6,15 @@ register = template.Library()
 @register.filter
 def addclass(field, css):
     return field.as_widget(attrs={'class': css})
+
+
+@register.simple_tag(takes_context=True)
+def url_replace(context, **params):
+    """Возвращает строку запроса текущей страницы с заменёнными
+    параметрами; пустые значения убирают параметр."""
+    query = context['request'].GET.copy()
+    for key, value in params.items():
+        query.pop(key, None)
+        if value:
+            query[key] = value
+    return query.urlencode()
@@ -0,0 +1,38 @@
+import copy
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+def temporary_caches(directory):
+    """CACHES проекта, в которых файловые кеши перенесены в directory:
+    cache.clear() в тестах не должен стирать рабочий кеш и хранилище
+    миниатюр на той же машине."""
+    caches = copy.deepcopy(settings.CACHES)
+    for name, params in caches.items():
+        if params.get('LOCATION', '').startswith(os.sep):
+            params['LOCATION'] = os.path.join(
+                directory, f'{name}-{os.path.basename(params["LOCATION"])}'
+            )
+    return caches
+
+
+class TemporaryCacheRunner(DiscoverRunner):
+    """Запускает тесты с кешем во временном каталоге."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache_settings = override_settings(
+            CACHES=temporary_caches(self.cache_dir)
+        )
+        self.cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_settings.disable()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -1,9 +1,105 @@
+import os
+import shutil
+import tempfile
+from multiprocessing import get_context
+
 from django.test import TestCase
 from http import HTTPStatus
 
+from core.cache_backends.sqlite import SQLiteCache
+
 
 class ViewTestClass(TestCase):
     def test_error_page(self):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+def make_cache(location, **options):
+    return SQLiteCache(location, {'OPTIONS': {'FLUSH_INTERVAL': 0, **options}})
+
+
+def increment(location, times):
+    cache = make_cache(location)
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = make_cache(self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_values_are_shared_between_instances(self):
+        """Значения видны другим экземплярам кеша с тем же файлом"""
+        self.cache.set('key', {'value': 1})
+        self.cache.set_many({'a': 1, 'b': 2})
+        other = make_cache(self.location)
+        self.assertEqual(other.get('key'), {'value': 1})
+        self.assertEqual(other.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        other.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_add_and_expiry(self):
+        """add не перезаписывает живое значение, истёкшее — заменяет"""
+        self.assertTrue(self.cache.add('key', 1))
+        self.assertFalse(self.cache.add('key', 2))
+        self.cache.set('key', 1, timeout=-1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 3))
+        self.assertEqual(self.cache.get('key'), 3)
+
+    def test_incr_is_atomic_across_processes(self):
+        """incr из нескольких процессов не теряет приращений"""
+        self.cache.set('counter', 0)
+        context = get_context('spawn')
+        workers = [
+            context.Process(target=increment, args=(self.location, 50))
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_least_recently_used_entries_are_evicted(self):
+        """При превышении размера вытесняются давно не читавшиеся записи"""
+        cache = make_cache(self.location, MAX_ENTRIES=3)
+        cache.set('first', 1)
+        cache.set('second', 2)
+        cache.set('third', 3)
+        cache.get('first')
+        cache.set('fourth', 4)
+        self.assertEqual(
+            cache.get_many(['first', 'second', 'third', 'fourth']),
+            {'first': 1, 'third': 3, 'fourth': 4}
+        )
+        stats = cache.get_stats()
+        self.assertEqual(stats['entries'], 3)
+        self.assertEqual(stats['evictions'], 1)
+
+    def test_stats_count_hits_and_misses(self):
+        """Статистика учитывает попадания и промахи"""
+        self.cache.set('key', 1)
+        self.cache.get('key')
+        self.cache.get_many(['key', 'missing'])
+        self.cache.get('missing')
+        stats = self.cache.get_stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 2)
+
+    def test_iter_keys_strips_prefix_and_version(self):
+        """iter_keys возвращает ключи без служебного префикса"""
+        self.cache.set_many({'sorl:image': 1, 'sorl:thumbs': 2, 'other': 3})
+        self.assertEqual(
+            sorted(self.cache.iter_keys('sorl:')),
+            ['sorl:image', 'sorl:thumbs']
+        )
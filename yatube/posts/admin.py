@@ -1,24 +1,286 @@
+import csv
+from itertools import chain
+
+from django import forms
+from django.conf import settings
 from django.contrib import admin
-from .models import Post, Group, Follow, Comment
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.admin.views.main import (
+    ERROR_FLAG, IGNORED_PARAMS, PAGE_VAR, SEARCH_VAR,
+)
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.contrib.auth import admin as auth_admin
+from django.contrib.auth import get_user_model
+from django.db.models import Max
+from django.http import StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.utils.html import format_html
+
+from .jobs import start_job
+from .models import AdminJob, Post, Group, Follow, Comment
+from .paginators import EstimatedCountPaginator
+from .search import match_expression, matching_ids
+
+
+class PreloadedAutocompleteSelect(AutocompleteSelect):
+    """Автодополнение, которое подписывает выбранное значение уже
+    загруженными объектами из preloaded, а не отдельным запросом."""
+    preloaded = None
+
+    def optgroups(self, name, value, attr=None):
+        selected = {
+            str(v) for v in value
+            if str(v) not in self.choices.field.empty_values
+        }
+        if (self.preloaded is None
+                or selected != {str(obj.pk) for obj in self.preloaded}):
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        for obj in self.preloaded:
+            label = self.choices.field.label_from_instance(obj)
+            options.append(self.create_option(
+                name, obj.pk, label, selected, len(options)
+            ))
+        return [(None, options, 0)]
+
+
+class LargeChangeListMixin:
+    """Список без точных COUNT(*) и без запросов на каждую строку.
+
+    Число записей оценивает EstimatedCountPaginator, связанные объекты
+    приходят через list_select_related, а автодополнение в list_editable
+    берёт подписи из них же.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.get_autocomplete_fields(request):
+            kwargs.setdefault('widget', PreloadedAutocompleteSelect(
+                db_field.remote_field, self.admin_site,
+                using=kwargs.get('using'),
+            ))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_changelist_form(self, request, **kwargs):
+        base = super().get_changelist_form(request, **kwargs)
+
+        class ChangeListForm(base):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                for name, field in self.fields.items():
+                    widget = getattr(field.widget, 'widget', field.widget)
+                    if isinstance(widget, PreloadedAutocompleteSelect):
+                        related = getattr(self.instance, name)
+                        widget.preloaded = [related] if related else []
+
+        return ChangeListForm
+
+
+class BackgroundJobMixin:
+    """Действия, которые после подтверждения запускают фоновое
+    задание AdminJob."""
+
+    def confirm_job(self, request, title, message, form=None):
+        """Страница подтверждения, которая повторно отправляет выбор
+        записей из списка вместе с полями form."""
+        return TemplateResponse(request, 'admin/posts/confirm_job.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': title,
+            'message': message,
+            'form': form,
+            'action': request.POST.get('action', ''),
+            'action_checkbox_name': ACTION_CHECKBOX_NAME,
+            'selected': request.POST.getlist(ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+        })
+
+    def job_selection(self, request, queryset):
+        """Аргументы задания, по которым оно само найдёт выбранные
+        записи. Отмеченные на странице записи передаются списком id, а
+        «выбрать все» — фильтрами и поиском списка и наибольшим id на
+        момент запуска: id всех записей в задание не попадают."""
+        if request.POST.get('select_across') != '1':
+            return {'ids': list(queryset.values_list('pk', flat=True))}
+        ignored = {*IGNORED_PARAMS, PAGE_VAR, ERROR_FLAG}
+        selection = {
+            'lookups': {
+                name: value for name, value in request.GET.items()
+                if name not in ignored
+            },
+            'last_id': queryset.aggregate(last=Max('pk'))['last'],
+        }
+        if request.GET.get(SEARCH_VAR, '').strip():
+            selection['search'] = request.GET[SEARCH_VAR]
+            selection['search_index'] = getattr(self, 'search_index', None)
+        return selection
+
+    def job_started(self, request, admin_job):
+        url = reverse('admin:posts_adminjob_change', args=(admin_job.pk,))
+        self.message_user(request, format_html(
+            'Запущено задание <a href="{}">{}</a>', url, admin_job
+        ))
+
+
+class Echo:
+    """Файл, который возвращает записанное: csv.writer через него
+    отдаёт строки для StreamingHttpResponse."""
+
+    def write(self, value):
+        return value
 
 
-class PostAdmin(admin.ModelAdmin):
+class ReassignGroupForm(forms.Form):
+    group = forms.ModelChoiceField(
+        Group.objects.order_by('title'), label='Группа'
+    )
+
+
+class FullTextSearchMixin:
+    """Поиск в админке по индексу FTS5 search_index вместо LIKE по
+    search_fields."""
+    search_index = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        if not match_expression(search_term):
+            return queryset.none(), False
+        return queryset.filter(
+            id__in=matching_ids(self.search_index, search_term)
+        ), False
+
+
+class GroupAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'title', 'slug', 'posts_count')
+    search_fields = ('title', 'slug')
+    prepopulated_fields = {'slug': ('title',)}
+
+
+class PostAdmin(LargeChangeListMixin, BackgroundJobMixin,
+                FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group')
+    list_select_related = ('author', 'group')
     list_editable = ('group',)
+    autocomplete_fields = ('author', 'group')
+    ordering = ('-pub_date', '-id')
     search_fields = ('text',)
+    search_index = 'posts_post_fts'
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
+    actions = ('reassign_group', 'export_csv')
+    csv_fields = ('pk', 'pub_date', 'author__username', 'group__slug',
+                  'text', 'image')
+
+    def reassign_group(self, request, queryset):
+        form = ReassignGroupForm(
+            request.POST if 'apply' in request.POST else None
+        )
+        if not form.is_valid():
+            return self.confirm_job(
+                request, 'Перенос постов в группу',
+                'Выбранные посты будут перенесены в группу:', form,
+            )
+        group = form.cleaned_data['group']
+        total = queryset.count()
+        self.job_started(request, start_job(
+            'reassign_group',
+            f'Перенос {total} постов в группу «{group}»',
+            total,
+            request.user,
+            group_id=group.pk,
+            **self.job_selection(request, queryset),
+        ))
+    reassign_group.short_description = 'Перенести в группу'
 
+    def export_csv(self, request, queryset):
+        """Отдаёт выбранные посты в CSV потоком, читая базу пачками."""
+        rows = queryset.order_by('pk').values_list(*self.csv_fields)
+        writer = csv.writer(Echo())
+        response = StreamingHttpResponse(
+            (writer.writerow(row) for row in chain(
+                [self.csv_fields],
+                rows.iterator(chunk_size=settings.ADMIN_JOB_BATCH_SIZE),
+            )),
+            content_type='text/csv; charset=utf-8',
+        )
+        response['Content-Disposition'] = 'attachment; filename="posts.csv"'
+        return response
+    export_csv.short_description = 'Выгрузить в CSV'
 
-class CommentAdmin(admin.ModelAdmin):
+
+class CommentAdmin(LargeChangeListMixin, FullTextSearchMixin,
+                   admin.ModelAdmin):
     list_display = ('pk', 'post', 'text', 'created', 'author')
+    list_select_related = ('post', 'author')
+    autocomplete_fields = ('post', 'author')
+    ordering = ('-created', '-id')
     search_fields = ('text',)
+    search_index = 'posts_comment_fts'
     list_filter = ('created',)
     empty_value_display = '-пусто-'
 
 
+class FollowAdmin(LargeChangeListMixin, admin.ModelAdmin):
+    list_display = ('pk', 'user', 'author')
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+
+
+class UserAdmin(BackgroundJobMixin, auth_admin.UserAdmin):
+    actions = ('purge_content',)
+
+    def purge_content(self, request, queryset):
+        """Удаляет посты и комментарии пользователей фоновыми
+        заданиями, не собирая дерево каскадного удаления целиком."""
+        if 'apply' not in request.POST:
+            return self.confirm_job(
+                request, 'Удаление постов и комментариев',
+                'Все посты и комментарии выбранных пользователей будут '
+                'удалены. Учётные записи останутся.',
+            )
+        for user in queryset:
+            total = (Post.objects.filter(author=user).count()
+                     + Comment.objects.filter(author=user).count())
+            self.job_started(request, start_job(
+                'purge_user_content',
+                f'Удаление постов и комментариев {user}',
+                total,
+                request.user,
+                user_id=user.pk,
+            ))
+    purge_content.short_description = 'Удалить посты и комментарии'
+
+
+class AdminJobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'description', 'status', 'progress', 'created',
+                    'finished', 'started_by')
+    list_select_related = ('started_by',)
+    list_filter = ('status',)
+
+    def progress(self, obj):
+        if not obj.total:
+            return f'{obj.processed}'
+        percent = obj.processed * 100 // obj.total
+        return f'{obj.processed} из {obj.total} ({percent}%)'
+    progress.short_description = 'Ход работы'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 # Register your models here.
 admin.site.register(Post, PostAdmin)
-admin.site.register(Group)
-admin.site.register(Follow)
+admin.site.register(Group, GroupAdmin)
+admin.site.register(Follow, FollowAdmin)
 admin.site.register(Comment, CommentAdmin)
+admin.site.register(AdminJob, AdminJobAdmin)
+admin.site.unregister(get_user_model())
+admin.site.register(get_user_model(), UserAdmin)
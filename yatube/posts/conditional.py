@@ -0,0 +1,48 @@
+import hashlib
+from functools import wraps
+
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+
+from .generations import get_validators
+
+
+def feed_etag(request, scope, generation):
+    """Слабый ETag страницы: поколение ленты, пользователь и адрес со
+    всеми параметрами, включая курсоры."""
+    raw = f'{scope}:{generation}:{request.user.pk}:{request.get_full_path()}'
+    return 'W/' + quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def feed_condition(scope_of):
+    """Отвечает на условный GET по поколению и времени последней записи
+    ленты, не обращаясь к постам и шаблонам.
+
+    scope_of(request, *args, **kwargs) возвращает ленту страницы или
+    None, если ленты нет; тогда представление выполняется как обычно.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            scope = scope_of(request, *args, **kwargs)
+            if scope is None:
+                return view(request, *args, **kwargs)
+            generation, last_modified = get_validators(scope)
+            etag = feed_etag(request, scope, generation)
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response.setdefault('ETag', etag)
+            response.setdefault('Last-Modified', http_date(last_modified))
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
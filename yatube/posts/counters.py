@@ -0,0 +1,97 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Group, Post, UserCounter
+
+User = get_user_model()
+
+
+def shifted(name, delta):
+    """Выражение для поля-счётчика name, изменённого на delta.
+
+    Уменьшение не опускает счётчик ниже нуля: разошедшийся с данными
+    счётчик иначе нарушил бы CHECK положительного поля и сорвал само
+    удаление. Расхождение исправляет recount_counters.
+    """
+    if delta < 0:
+        return Greatest(F(name) + delta, 0)
+    return F(name) + delta
+
+
+def change_user_counter(user_id, **deltas):
+    """Атомарно изменяет счётчики пользователя на deltas.
+
+    Строка счётчиков создаётся только при увеличении: при уменьшении
+    её отсутствие означает, что пользователь уже удаляется.
+    """
+    changes = {name: shifted(name, delta) for name, delta in deltas.items()}
+    updated = UserCounter.objects.filter(user_id=user_id).update(**changes)
+    if updated or min(deltas.values()) < 0:
+        return
+    _, created = UserCounter.objects.get_or_create(
+        user_id=user_id, defaults=deltas
+    )
+    if not created:
+        UserCounter.objects.filter(user_id=user_id).update(**changes)
+
+
+def change_group_counter(group_id, delta):
+    if group_id is not None:
+        Group.objects.filter(pk=group_id).update(
+            posts_count=shifted('posts_count', delta)
+        )
+
+
+def change_comment_counter(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=shifted('comments_count', delta)
+    )
+
+
+def get_user_counter(user):
+    """Возвращает счётчики пользователя, не создавая строку в базе."""
+    try:
+        return user.counters
+    except UserCounter.DoesNotExist:
+        return UserCounter(user=user)
+
+
+def count_of(model, field):
+    """Подзапрос с числом строк model, ссылающихся через field
+    на текущую строку внешнего запроса."""
+    rows = model.objects.filter(**{field: OuterRef('pk')}).order_by()
+    return Coalesce(Subquery(
+        rows.values(field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def recount(dry_run=False):
+    """Пересчитывает все счётчики одним UPDATE на таблицу.
+
+    Возвращает число строк с расхождениями для каждого счётчика.
+    """
+    if not dry_run:
+        missing = User.objects.filter(
+            counters__isnull=True
+        ).values_list('pk', flat=True)
+        UserCounter.objects.bulk_create(
+            (UserCounter(user_id=user_id) for user_id in missing.iterator()),
+            ignore_conflicts=True,
+        )
+    counters = {
+        (Group, 'posts_count'): count_of(Post, 'group'),
+        (Post, 'comments_count'): count_of(Comment, 'post'),
+        (UserCounter, 'posts_count'): count_of(Post, 'author'),
+        (UserCounter, 'followers_count'): count_of(Follow, 'author'),
+        (UserCounter, 'following_count'): count_of(Follow, 'user'),
+    }
+    drift = {}
+    for (model, field), expected in counters.items():
+        drifted = model.objects.annotate(expected=expected).exclude(
+            **{field: F('expected')}
+        )
+        drift[f'{model.__name__}.{field}'] = count = drifted.count()
+        if count and not dry_run:
+            model.objects.update(**{field: expected})
+    return drift
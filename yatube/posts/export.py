@@ -0,0 +1,53 @@
+import json
+
+from django.utils import timezone
+
+from .models import Comment, Post
+from .serializers import PostSerializer, datetime_representation
+
+# Что выгружается: модель, поля values() и пути к slug группы и имени
+# автора для фильтров.
+EXPORTS = {
+    'posts': (
+        Post, PostSerializer.Meta.fields, 'group__slug', 'author__username'
+    ),
+    'comments': (
+        Comment,
+        ('id', 'post', 'author', 'text', 'created'),
+        'post__group__slug',
+        'author__username',
+    ),
+}
+DATE_FIELDS = ('pub_date', 'created')
+
+
+def export_rows(kind, group=None, author=None):
+    """Строки values() выгрузки kind в порядке id, отфильтрованные по
+    slug группы и имени автора."""
+    model, fields, group_path, author_path = EXPORTS[kind]
+    rows = model.objects.all()
+    if group is not None:
+        rows = rows.filter(**{group_path: group})
+    if author is not None:
+        rows = rows.filter(**{author_path: author})
+    return rows.order_by('pk').values(*fields)
+
+
+def export_ndjson(kind, chunk_size, group=None, author=None):
+    """Выгрузка kind в NDJSON. База читается через iterator() пачками
+    по chunk_size, и на каждую пачку отдаётся один кусок текста, так что
+    память не зависит от размера выгрузки."""
+    fields = EXPORTS[kind][1]
+    dates = [name for name in DATE_FIELDS if name in fields]
+    tz = timezone.get_current_timezone()
+    rows = export_rows(kind, group, author).iterator(chunk_size=chunk_size)
+    lines = []
+    for row in rows:
+        for name in dates:
+            row[name] = datetime_representation(row[name], tz)
+        lines.append(json.dumps(row, ensure_ascii=False))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
@@ -0,0 +1,155 @@
+import heapq
+from itertools import dropwhile, islice, takewhile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import FeedEntry, Follow, Post
+from .paginators import CursorPaginator
+
+TIMELINE_KEY = 'posts:timeline:{}'
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост по лентам подписчиков автора пачками."""
+    batch_size = settings.FOLLOW_FEED_BATCH_SIZE
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).order_by('user_id').values_list('user_id', flat=True)
+    last_user_id = 0
+    while True:
+        batch = list(followers.filter(user_id__gt=last_user_id)[:batch_size])
+        if not batch:
+            break
+        FeedEntry.objects.bulk_create(
+            [
+                FeedEntry(
+                    user_id=user_id,
+                    author_id=post.author_id,
+                    post_id=post.id,
+                    pub_date=post.pub_date,
+                )
+                for user_id in batch
+            ],
+            ignore_conflicts=True,
+        )
+        last_user_id = batch[-1]
+
+
+def backfill_feed(follow):
+    """Добавляет в ленту подписчика последние посты нового автора."""
+    posts = follow.author.posts.order_by('-pub_date', '-id').values_list(
+        'id', 'pub_date'
+    )[:settings.FOLLOW_FEED_BACKFILL]
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(
+                user_id=follow.user_id,
+                author_id=follow.author_id,
+                post_id=post_id,
+                pub_date=pub_date,
+            )
+            for post_id, pub_date in posts
+        ],
+        batch_size=settings.FOLLOW_FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def prune_feed(follow):
+    """Убирает из ленты подписчика посты автора, от которого он отписался."""
+    FeedEntry.objects.filter(
+        user_id=follow.user_id,
+        author_id=follow.author_id,
+    ).delete()
+
+
+def rebuild_feeds():
+    """Заново заполняет ленты подписок из подписок и постов."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        FeedEntry.objects.all().delete()
+        cursor.execute(
+            'INSERT INTO posts_feedentry '
+            '(user_id, author_id, post_id, pub_date) '
+            'SELECT f.user_id, p.author_id, p.id, p.pub_date '
+            'FROM posts_follow f '
+            'JOIN posts_post p ON p.author_id = f.author_id'
+        )
+
+
+def author_timelines(author_ids):
+    """Возвращает закешированные ключи (pub_date, id) последних постов
+    каждого автора, от новых к старым."""
+    keys = {TIMELINE_KEY.format(author_id): author_id
+            for author_id in author_ids}
+    timelines = cache.get_many(keys)
+    missing = [author_id for key, author_id in keys.items()
+               if key not in timelines]
+    if missing:
+        loaded = load_timelines(missing)
+        cache.set_many(loaded, settings.AUTHOR_TIMELINE_TIMEOUT)
+        timelines.update(loaded)
+    return list(timelines.values())
+
+
+def load_timelines(author_ids, chunk_size=500):
+    """Выбирает последние посты нескольких авторов одним запросом
+    на пачку авторов."""
+    timelines = {TIMELINE_KEY.format(author_id): []
+                 for author_id in author_ids}
+    for start in range(0, len(author_ids), chunk_size):
+        chunk = author_ids[start:start + chunk_size]
+        posts = Post.objects.raw(
+            'SELECT id, author_id, pub_date FROM ('
+            '  SELECT id, author_id, pub_date, ROW_NUMBER() OVER ('
+            '    PARTITION BY author_id ORDER BY pub_date DESC, id DESC'
+            '  ) AS position FROM posts_post'
+            f'  WHERE author_id IN ({", ".join(["%s"] * len(chunk))})'
+            ') WHERE position <= %s '
+            'ORDER BY author_id, pub_date DESC, id DESC',
+            [*chunk, settings.AUTHOR_TIMELINE_SIZE],
+        )
+        for post in posts:
+            timelines[TIMELINE_KEY.format(post.author_id)].append(
+                (post.pub_date, post.id)
+            )
+    return timelines
+
+
+def invalidate_timeline(author_id):
+    cache.delete(TIMELINE_KEY.format(author_id))
+
+
+class MergedFeedPaginator(CursorPaginator):
+    """Лента подписок, собранная слиянием лент авторов из кеша.
+
+    Посты не раскладываются по лентам подписчиков, поэтому публикация
+    у автора с любым числом подписчиков стоит одной инвалидации кеша.
+    Глубина ленты ограничена AUTHOR_TIMELINE_SIZE постами на автора.
+    """
+
+    def __init__(self, author_ids, per_page):
+        super().__init__(
+            Post.objects.select_related('author', 'group'), per_page
+        )
+        self.author_ids = list(author_ids)
+
+    def _fetch(self, values, forward, limit):
+        timelines = author_timelines(self.author_ids)
+        key = tuple(values) if values is not None else None
+        if forward:
+            if key is not None:
+                timelines = [
+                    dropwhile(lambda entry: entry >= key, timeline)
+                    for timeline in timelines
+                ]
+            merged = heapq.merge(*timelines, reverse=True)
+        else:
+            merged = heapq.merge(*(
+                reversed(list(takewhile(lambda entry: entry > key, timeline)))
+                for timeline in timelines
+            ))
+        ids = [post_id for _, post_id in islice(merged, limit)]
+        posts = self.object_list.in_bulk(ids)
+        return [posts[post_id] for post_id in ids if post_id in posts]
@@ -1,4 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+
+from .images import ingest_image
 from .models import Post, Comment
 
 
@@ -17,6 +20,12 @@ class PostForm(forms.ModelForm):
             'image': 'Картинка',
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            return ingest_image(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
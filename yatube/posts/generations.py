@@ -0,0 +1,88 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+GENERATION_KEY = 'posts:generation:{}'
+MODIFIED_KEY = 'posts:modified:{}'
+
+
+def initial_generation():
+    """Поколение, с которого начинается ещё не созданный или вытесненный
+    счётчик. Берётся из часов, чтобы не совпасть с поколениями,
+    под которыми уже закешированы фрагменты."""
+    return time.time_ns() // 1000
+
+
+def post_scopes(post, group_id=None):
+    """Ленты, на которые влияет изменение поста, и сам пост."""
+    scopes = ['index', f'author:{post.author_id}', f'post:{post.id}']
+    for scope_group_id in {post.group_id, group_id} - {None}:
+        scopes.append(f'group:{scope_group_id}')
+    return scopes
+
+
+def bump_generations(scopes):
+    """Увеличивает поколения лент, делая их закешированные фрагменты
+    устаревшими, и запоминает время записи в них."""
+    for scope in scopes:
+        key = GENERATION_KEY.format(scope)
+        cache.add(key, initial_generation(), None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, initial_generation(), None)
+    modified = int(time.time())
+    cache.set_many(
+        {MODIFIED_KEY.format(scope): modified for scope in scopes}, None
+    )
+
+
+def get_generation(scope):
+    return cache.get_or_set(
+        GENERATION_KEY.format(scope), initial_generation, None
+    )
+
+
+def has_generation(scope):
+    """Заведено ли уже поколение ленты."""
+    return cache.get(GENERATION_KEY.format(scope)) is not None
+
+
+def get_generations(scopes):
+    """Поколения нескольких лент одним чтением кеша."""
+    keys = {GENERATION_KEY.format(scope): scope for scope in scopes}
+    found = cache.get_many(keys)
+    return {
+        scope: found[key] if key in found else get_generation(scope)
+        for key, scope in keys.items()
+    }
+
+
+def get_validators(scope):
+    """Поколение ленты и время последней записи в неё в секундах.
+    Обычно это одно чтение кеша.
+
+    Вытесненное время записи заменяется текущим: оно не раньше
+    настоящего, поэтому клиент не получит устаревшую страницу.
+    """
+    keys = (GENERATION_KEY.format(scope), MODIFIED_KEY.format(scope))
+    found = cache.get_many(keys)
+    generation = found.get(keys[0])
+    if generation is None:
+        generation = get_generation(scope)
+    modified = found.get(keys[1])
+    if modified is None:
+        modified = cache.get_or_set(
+            keys[1], lambda: int(time.time()), None
+        )
+    return generation, modified
+
+
+def feed_cache(scope):
+    """Контекст для фрагментного кеша ленты: ключ меняется при каждой
+    записи в ленту, поэтому срок хранения может быть долгим."""
+    return {
+        'feed_cache_timeout': settings.FEED_CACHE_TIMEOUT,
+        'feed_generation': get_generation(scope),
+    }
@@ -0,0 +1,162 @@
+import base64
+import logging
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+EXIF_ORIENTATION = 0x0112
+# Значения EXIF Orientation, при которых картинка повёрнута на 90°.
+ROTATED = {5, 6, 7, 8}
+# Телефоны сохраняют снимки как MPO: это JPEG с дополнительными кадрами
+# (стереопара, превью). Pillow не умеет записывать MPO, поэтому такие
+# картинки проверяются и сохраняются как JPEG с одним основным кадром.
+FORMAT_ALIASES = {'MPO': 'JPEG'}
+
+
+def read_image_metadata(file):
+    """Возвращает ширину и высоту картинки с учётом EXIF-поворота и
+    заглушку — крошечную JPEG-копию в виде data URI.
+
+    JPEG декодируется в режиме draft с уменьшением при чтении, так что
+    полноразмерное изображение в память не попадает.
+    """
+    size = settings.POST_IMAGE_PLACEHOLDER_SIZE
+    with Image.open(file) as image:
+        width, height = image.size
+        if image.getexif().get(EXIF_ORIENTATION) in ROTATED:
+            width, height = height, width
+        image.draft('RGB', (size, size))
+        image.thumbnail((size, size))
+        placeholder = ImageOps.exif_transpose(image).convert('RGB')
+    buffer = BytesIO()
+    placeholder.save(
+        buffer, 'JPEG', quality=settings.POST_IMAGE_PLACEHOLDER_QUALITY
+    )
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return width, height, f'data:image/jpeg;base64,{encoded}'
+
+
+def set_image_metadata(post):
+    """Заполняет размеры и заглушку картинки поста. Возвращает False,
+    если картинку не удалось прочитать."""
+    post.image_width = post.image_height = None
+    post.image_placeholder = ''
+    if not post.image:
+        return True
+    try:
+        file = post.image.file
+        file.seek(0)
+        try:
+            metadata = read_image_metadata(file)
+        finally:
+            file.seek(0)
+    except Exception:
+        logger.exception('Не удалось прочитать картинку %s', post.image)
+        return False
+    post.image_width, post.image_height, post.image_placeholder = metadata
+    return True
+
+
+def image_format(image):
+    """Формат, в котором картинка проверяется и сохраняется."""
+    return FORMAT_ALIASES.get(image.format, image.format)
+
+
+def pixel_limit(image):
+    """Сколько пикселей можно декодировать: JPEG читается сразу
+    уменьшенным (draft), остальные форматы — целиком."""
+    if image_format(image) == 'JPEG':
+        return settings.POST_IMAGE_MAX_PIXELS
+    return min(
+        settings.POST_IMAGE_MAX_PIXELS, settings.POST_IMAGE_MAX_DECODED_PIXELS
+    )
+
+
+def check_image_header(image):
+    """Проверяет формат и размер картинки по заголовку, не декодируя
+    пиксели."""
+    if image_format(image) not in settings.POST_IMAGE_FORMATS:
+        raise ValidationError(
+            'Поддерживаются картинки форматов %(formats)s.',
+            code='invalid_image_format',
+            params={'formats': ', '.join(settings.POST_IMAGE_FORMATS)},
+        )
+    width, height = image.size
+    if width * height > pixel_limit(image):
+        raise ValidationError(
+            'Картинка слишком большая: %(width)s×%(height)s пикселей.',
+            code='image_too_large',
+            params={'width': width, 'height': height},
+        )
+
+
+def ingest_image(upload):
+    """Проверяет загруженную картинку и возвращает её копию, уменьшенную
+    до POST_IMAGE_MAX_SIDE и очищенную от метаданных.
+
+    JPEG декодируется сразу в уменьшенном виде (draft), остальные
+    форматы уменьшаются через reduce; результат пишется во временный
+    файл, который остаётся в памяти только пока он небольшой.
+    Анимированные картинки в пределах размера сохраняются как есть,
+    а больше него — отклоняются: уменьшение оставило бы один кадр.
+    """
+    if upload.size > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+        raise ValidationError(
+            'Файл больше %(size)s МБ.',
+            code='file_too_large',
+            params={'size': settings.POST_IMAGE_MAX_UPLOAD_SIZE // 2**20},
+        )
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    upload.seek(0)
+    try:
+        with Image.open(upload) as image:
+            check_image_header(image)
+            save_format = image_format(image)
+            animated = (
+                getattr(image, 'is_animated', False)
+                and image.format not in FORMAT_ALIASES
+            )
+            if animated:
+                if max(image.size) > max_side:
+                    raise ValidationError(
+                        'Анимированная картинка больше %(side)s пикселей '
+                        'по стороне.',
+                        code='animation_too_large',
+                        params={'side': max_side},
+                    )
+                upload.seek(0)
+                return upload
+            icc_profile = image.info.get('icc_profile')
+            image.thumbnail((max_side, max_side))
+            image = ImageOps.exif_transpose(image)
+            # Без EXIF, XMP и комментариев: Pillow иначе переносит их из info.
+            image.info = {
+                key: value for key, value in image.info.items()
+                if key == 'transparency'
+            }
+            if save_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            output = tempfile.SpooledTemporaryFile(
+                max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+            )
+            options = {'quality': settings.POST_IMAGE_QUALITY}
+            if icc_profile:
+                options['icc_profile'] = icc_profile
+            if save_format == 'JPEG':
+                options['progressive'] = True
+            image.save(output, save_format, **options)
+    except (OSError, SyntaxError, Image.DecompressionBombError) as error:
+        # Заголовок бывает целым, а данные — обрезанными: ошибка
+        # всплывает только при декодировании.
+        raise ValidationError(
+            'Не удалось прочитать картинку: файл повреждён.',
+            code='invalid_image',
+        ) from error
+    output.seek(0)
+    return File(output, name=upload.name)
@@ -0,0 +1,181 @@
+import json
+import logging
+import traceback
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .counters import change_group_counter
+from .generations import bump_generations
+from .models import AdminJob, Comment, Post
+from .search import matching_ids
+
+logger = logging.getLogger(__name__)
+
+JOBS = {}
+_executor = None
+
+
+def job(action):
+    """Регистрирует задание action. Функция задания получает аргументы
+    из AdminJob.arguments и после каждой пачки отдаёт число
+    обработанных в ней записей."""
+    def register(function):
+        JOBS[action] = function
+        return function
+    return register
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.ADMIN_JOB_WORKERS,
+            thread_name_prefix='admin-jobs',
+        )
+    return _executor
+
+
+def start_job(action, description, total, user=None, **arguments):
+    """Создаёт задание и ставит его в фоновую очередь процесса после
+    фиксации транзакции."""
+    admin_job = AdminJob.objects.create(
+        action=action,
+        description=description[:200],
+        arguments=json.dumps(arguments),
+        total=total,
+        started_by=user,
+    )
+    if settings.ADMIN_JOB_WORKERS:
+        transaction.on_commit(
+            lambda: get_executor().submit(run_job_in_thread, admin_job.pk)
+        )
+    else:
+        transaction.on_commit(lambda: run_job(admin_job.pk))
+    return admin_job
+
+
+def run_job(pk):
+    """Выполняет задание из очереди, записывая ход работы и отметку
+    heartbeat после каждой пачки. Задание, которое уже взял другой
+    процесс, пропускается. Возвращает True, если задание выполнено."""
+    jobs = AdminJob.objects.filter(pk=pk)
+    claimed = jobs.filter(status=AdminJob.QUEUED).update(
+        status=AdminJob.RUNNING, processed=0, heartbeat=timezone.now()
+    )
+    if not claimed:
+        return False
+    admin_job = jobs.get()
+    try:
+        for processed in JOBS[admin_job.action](
+            **json.loads(admin_job.arguments)
+        ):
+            jobs.update(
+                processed=F('processed') + processed,
+                heartbeat=timezone.now(),
+            )
+    except Exception:
+        logger.exception('Задание %s завершилось ошибкой', admin_job)
+        jobs.update(
+            status=AdminJob.FAILED,
+            error=traceback.format_exc(),
+            finished=timezone.now(),
+        )
+        return False
+    jobs.update(status=AdminJob.DONE, finished=timezone.now())
+    return True
+
+
+def stale_jobs(stale_after):
+    """Задания, брошенные остановленным процессом: выполняемые без
+    отметки heartbeat дольше stale_after и так и не взятые из очереди.
+    Потоки заданий живут внутри процесса сервера, и после перезапуска
+    их никто не продолжит."""
+    deadline = timezone.now() - stale_after
+    return AdminJob.objects.filter(
+        Q(status=AdminJob.RUNNING, heartbeat__lt=deadline)
+        | Q(status=AdminJob.QUEUED, created__lt=deadline)
+    )
+
+
+def run_job_in_thread(pk):
+    try:
+        run_job(pk)
+    finally:
+        connection.close()
+
+
+def id_batches(queryset, batch_size):
+    """Перебирает id записей queryset пачками по возрастанию; каждая
+    пачка читается заново за последним id, поэтому записи можно удалять
+    по ходу перебора."""
+    ids = queryset.order_by('pk').values_list('pk', flat=True)
+    last_id = 0
+    while True:
+        batch = list(ids.filter(pk__gt=last_id)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1]
+
+
+def selected_rows(queryset, ids=None, lookups=None, search=None,
+                  search_index=None, last_id=None):
+    """Записи queryset, выбранные в списке админки: по списку id или,
+    для «выбрать все», по фильтрам и поиску списка среди записей с id
+    не больше last_id."""
+    if ids is not None:
+        return queryset.filter(pk__in=ids)
+    queryset = queryset.filter(pk__lte=last_id or 0, **(lookups or {}))
+    if search:
+        queryset = queryset.filter(id__in=matching_ids(search_index, search))
+    return queryset
+
+
+@job('reassign_group')
+def reassign_group(group_id, **selection):
+    """Переносит посты в группу одним UPDATE на пачку и поправляет
+    счётчики групп и поколения лент, которые update() обходит."""
+    batch_size = settings.ADMIN_JOB_BATCH_SIZE
+    selected = selected_rows(Post.objects.all(), **selection)
+    for batch in id_batches(selected, batch_size):
+        with transaction.atomic():
+            posts = Post.objects.filter(pk__in=batch).exclude(
+                group_id=group_id
+            )
+            moved = list(posts.values_list('id', 'author_id', 'group_id'))
+            posts.update(group_id=group_id, updated=timezone.now())
+            if moved:
+                for old_group_id, count in Counter(
+                    old_group_id for _, _, old_group_id in moved
+                ).items():
+                    change_group_counter(old_group_id, -count)
+                change_group_counter(group_id, len(moved))
+                scopes = {'index', f'group:{group_id}'}
+                for post_id, author_id, old_group_id in moved:
+                    scopes.add(f'author:{author_id}')
+                    scopes.add(f'post:{post_id}')
+                    if old_group_id is not None:
+                        scopes.add(f'group:{old_group_id}')
+                bump_generations(sorted(scopes))
+        yield len(batch)
+
+
+@job('purge_user_content')
+def purge_user_content(user_id):
+    """Удаляет комментарии, а затем посты пользователя пачками.
+
+    Каждая пачка удаляется в своей транзакции обычным delete(), так что
+    каскад и сигналы счётчиков обрабатывают не больше пачки за раз.
+    """
+    batch_size = settings.ADMIN_JOB_BATCH_SIZE
+    for model in (Comment, Post):
+        rows = model.objects.filter(author_id=user_id)
+        for batch in id_batches(rows, batch_size):
+            with transaction.atomic():
+                model.objects.filter(pk__in=batch).delete()
+            yield len(batch)
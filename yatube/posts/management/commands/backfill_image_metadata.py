@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.generations import bump_generations, post_scopes
+from posts.images import set_image_metadata
+from posts.models import Post
+
+FIELDS = ('image_width', 'image_height', 'image_placeholder', 'updated')
+
+
+class Command(BaseCommand):
+    help = ('Заполняет размеры и заглушки картинок существующих постов, '
+            'читая картинки по одной')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересчитать и уже заполненные посты',
+        )
+
+    def save(self, batch):
+        """bulk_update обходит сигналы, поэтому поколения лент с этими
+        постами увеличиваются здесь: иначе закешированные фрагменты
+        остались бы без размеров и заглушек."""
+        Post.objects.bulk_update(batch, FIELDS)
+        bump_generations(sorted(
+            {scope for post in batch for scope in post_scopes(post)}
+        ))
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').only(
+            'id', 'image', 'group', 'author'
+        )
+        if not options['force']:
+            posts = posts.filter(image_width__isnull=True)
+        batch_size = options['batch_size']
+        started = time.monotonic()
+        done = failed = 0
+        batch = []
+        for post in posts.order_by('id').iterator(chunk_size=batch_size):
+            done += 1
+            ok = set_image_metadata(post)
+            post.image.close()
+            if not ok:
+                failed += 1
+                continue
+            # Новая дата изменения сбрасывает закешированные карточки.
+            post.updated = timezone.now()
+            batch.append(post)
+            if len(batch) >= batch_size:
+                self.save(batch)
+                batch = []
+                self.stdout.write(f'Обработано картинок: {done}')
+        self.save(batch)
+        self.stdout.write(
+            f'Обработано картинок: {done}, с ошибками: {failed}, '
+            f'за {time.monotonic() - started:.1f} с'
+        )
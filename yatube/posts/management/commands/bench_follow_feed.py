@@ -0,0 +1,86 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.feeds import TIMELINE_KEY, MergedFeedPaginator
+from posts.models import Follow, Post
+from posts.paginators import CursorPaginator
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает ленту подписок через JOIN с лентой, собранной '
+            'слиянием лент авторов. Данные создаются во временной '
+            'транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--authors', type=int, nargs='+', default=[10, 100, 1000]
+        )
+        parser.add_argument('--posts-per-author', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--per-page', type=int, default=10)
+
+    def handle(self, *args, **options):
+        for authors in options['authors']:
+            try:
+                with transaction.atomic():
+                    self.run(authors, options)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def run(self, authors, options):
+        reader = User.objects.create_user('bench_follow_feed_reader')
+        User.objects.bulk_create(
+            User(username=f'bench_follow_feed_{i}') for i in range(authors)
+        )
+        author_ids = list(User.objects.filter(
+            username__startswith='bench_follow_feed_'
+        ).exclude(id=reader.id).values_list('id', flat=True))
+        Post.objects.bulk_create(
+            (
+                Post(author_id=author_id, text=f'Пост {i}')
+                for author_id in author_ids
+                for i in range(options['posts_per_author'])
+            ),
+        )
+        Follow.objects.bulk_create(
+            (Follow(user=reader, author_id=author_id)
+             for author_id in author_ids),
+        )
+        per_page = options['per_page']
+
+        def join():
+            posts = Post.objects.filter(
+                author__following__user=reader
+            ).select_related('author', 'group')
+            return CursorPaginator(posts, per_page).cursor_page()
+
+        def merge():
+            ids = reader.follower.values_list('author_id', flat=True)
+            return MergedFeedPaginator(ids, per_page).cursor_page()
+
+        def merge_cold():
+            cache.delete_many(TIMELINE_KEY.format(i) for i in author_ids)
+            return merge()
+
+        assert list(join()) == list(merge())
+        for name, feed in (('join', join), ('merge', merge),
+                           ('merge, холодный кеш', merge_cold)):
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                list(feed())
+            elapsed = (time.perf_counter() - started) / options['repeat']
+            self.stdout.write(
+                f'{authors:>5} авторов  {name:<20} {elapsed * 1000:8.2f} мс'
+            )
+        cache.delete_many(TIMELINE_KEY.format(i) for i in author_ids)
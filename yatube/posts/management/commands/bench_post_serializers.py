@@ -0,0 +1,68 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import Group, Post
+from posts.serializers import PostSerializer, post_values, represent_posts
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает стоимость одного поста в PostSerializer DRF и '
+            'в быстром пути через values(). Данные создаются во временной '
+            'транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts', type=int, nargs='+', default=[100, 1000, 10000]
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        for posts in options['posts']:
+            try:
+                with transaction.atomic():
+                    self.run(posts, options)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def run(self, posts, options):
+        author = User.objects.create_user('bench_post_serializers')
+        group = Group.objects.create(
+            title='bench', slug='bench_post_serializers'
+        )
+        Post.objects.bulk_create(
+            (
+                Post(author=author, group=group if i % 2 else None,
+                     text=f'Пост {i}')
+                for i in range(posts)
+            ),
+        )
+        queryset = Post.objects.filter(author=author).order_by('-id')
+
+        # Каждый замер читает посты заново: закешированный queryset
+        # скрыл бы стоимость создания моделей.
+        def drf():
+            return PostSerializer(queryset.all(), many=True).data
+
+        def values():
+            return represent_posts(post_values(queryset.all()))
+
+        assert [dict(post) for post in drf()] == values()
+        for name, serialize in (('DRF', drf), ('values()', values)):
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                serialize()
+            elapsed = (time.perf_counter() - started) / options['repeat']
+            self.stdout.write(
+                f'{posts:>6} постов  {name:<10} {elapsed * 1000:9.2f} мс  '
+                f'{elapsed / posts * 1e6:7.2f} мкс на пост'
+            )
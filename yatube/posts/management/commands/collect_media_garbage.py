@@ -0,0 +1,74 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.media_gc import RateLimiter, find_orphaned_media, remove_media
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки постов и миниатюры, на которые больше не '
+            'ссылается ни один пост')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только вывести файлы, которые будут удалены',
+        )
+        parser.add_argument(
+            '--quarantine',
+            help='Переносить файлы в этот каталог вместо удаления',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=24 * 60 * 60,
+            help='Не трогать файлы моложе стольких секунд: их пост '
+                 'может быть ещё не сохранён',
+        )
+        parser.add_argument(
+            '--max-rate',
+            type=float,
+            default=100,
+            help='Не больше стольких удалений в секунду; 0 — без '
+                 'ограничения',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100_000,
+            help='Сколько имён сортировать в памяти за раз',
+        )
+
+    def handle(self, *args, **options):
+        root = settings.MEDIA_ROOT
+        limiter = RateLimiter(options['max_rate'])
+        newest = time.time() - options['min_age']
+        started = time.monotonic()
+        removed = skipped = size = 0
+        for name in find_orphaned_media(root, options['chunk_size']):
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime > newest:
+                skipped += 1
+                continue
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                limiter.wait()
+                try:
+                    remove_media(root, name, options['quarantine'])
+                except FileNotFoundError:
+                    continue
+            removed += 1
+            size += stat.st_size
+        verb = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(
+            f'{verb} файлов: {removed} ({size / 2**20:.1f} МБ), '
+            f'пропущено новых: {skipped}, '
+            f'за {time.monotonic() - started:.1f} с'
+        )
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.export import EXPORTS, export_ndjson
+
+
+class Command(BaseCommand):
+    help = ('Выгружает посты или комментарии в NDJSON, по строке на '
+            'запись, читая базу пачками')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--group', help='slug группы')
+        parser.add_argument('--author', help='имя автора')
+        parser.add_argument('--output', help='файл; по умолчанию stdout')
+        parser.add_argument(
+            '--chunk-size', type=int, default=settings.EXPORT_CHUNK_SIZE
+        )
+
+    def handle(self, *args, **options):
+        chunks = export_ndjson(
+            options['kind'],
+            options['chunk_size'],
+            group=options['group'],
+            author=options['author'],
+        )
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            output.writelines(chunks)
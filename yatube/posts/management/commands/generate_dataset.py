@@ -0,0 +1,312 @@
+import datetime
+import random
+import re
+import time
+from io import BytesIO
+from itertools import accumulate, chain, islice
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+from PIL import Image, ImageDraw
+
+from posts.generations import bump_generations
+from posts.images import read_image_metadata
+from posts.models import Comment, Follow, Group, Post
+from posts.search import drop_search_indexes, ensure_search_indexes
+
+User = get_user_model()
+
+
+def power_law_weights(count, alpha):
+    """Накопленные веса рангов 1/rank^alpha для random.choices."""
+    return list(accumulate(1 / rank ** alpha for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = ('Создаёт воспроизводимый синтетический набор данных: '
+            'пользователей, группы, посты с картинками, комментарии и '
+            'подписки со степенным распределением подписчиков. Строки '
+            'вставляются напрямую через executemany.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument('--follows', type=int, default=100000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--alpha', type=float, default=1.1,
+            help='Показатель степенного закона для авторов и подписок',
+        )
+        parser.add_argument(
+            '--images', type=int, default=20,
+            help='Сколько разных картинок создать для постов',
+        )
+        parser.add_argument(
+            '--image-ratio', type=float, default=0.3,
+            help='Доля постов с картинкой',
+        )
+        parser.add_argument(
+            '--start', type=datetime.date.fromisoformat,
+            default=datetime.date(2020, 1, 1),
+            help='Дата первого поста',
+        )
+        parser.add_argument('--days', type=int, default=365 * 3)
+        parser.add_argument(
+            '--prefix', default='synthetic',
+            help='Начало имён пользователей и slug групп',
+        )
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--no-rebuild', action='store_true',
+            help=('Не строить ленты подписок; на миллионах подписок их лучше '
+                  'построить потом отдельно. Счётчики пересчитываются '
+                  'всегда'),
+        )
+
+    def handle(self, *args, **options):
+        self.check_prefix(options['prefix'])
+        self.options = options
+        self.random = random.Random(options['seed'])
+        # Faker медленный, поэтому он только заполняет словарь, из
+        # которого тексты собираются на лету.
+        faker = Faker('ru_RU')
+        faker.seed_instance(options['seed'])
+        self.sentences = [faker.sentence() for _ in range(2000)]
+        self.first_names = [faker.first_name() for _ in range(500)]
+        self.last_names = [faker.last_name() for _ in range(500)]
+        self.adapt = connection.ops.adapt_datetimefield_value
+        self.start = timezone.make_aware(
+            datetime.datetime.combine(options['start'], datetime.time())
+        )
+        self.span = datetime.timedelta(days=options['days'])
+
+        self.user_ids = self.insert(User, self.user_rows(), options['users'])
+        # Популярность не совпадает с порядком id: ранги раздаются
+        # пользователям в случайном порядке.
+        self.popular = list(self.user_ids)
+        self.random.shuffle(self.popular)
+        self.weights = power_law_weights(len(self.popular), options['alpha'])
+        self.group_ids = self.insert(
+            Group, self.group_rows(), options['groups']
+        )
+        self.images = self.create_images()
+        # Триггеры поиска замедляют вставку в разы, поэтому индексы
+        # пересобираются одним проходом в конце. Всё это одна транзакция:
+        # другие соединения видят индексы целыми, а при ошибке они
+        # откатываются вместе со вставленными строками.
+        with transaction.atomic():
+            drop_search_indexes(connection)
+            self.post_ids = self.insert(
+                Post, self.post_rows(), options['posts']
+            )
+            self.post_weights = power_law_weights(
+                len(self.post_ids), options['alpha']
+            )
+            self.insert(Comment, self.comment_rows(), options['comments'])
+            ensure_search_indexes(connection)
+        self.insert(
+            Follow, self.follow_rows(), options['follows'],
+            ignore_conflicts=True,
+        )
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                no_style(), [User, Group, Post, Comment, Follow]
+            ):
+                cursor.execute(sql)
+        # Новые посты попадают только в уже закешированную главную:
+        # группы и авторы созданы этой же командой.
+        bump_generations(['index'])
+        # Строки вставлены мимо сигналов, так что счётчики нулевые; их
+        # пересчёт — по одному UPDATE на таблицу.
+        call_command('recount_counters', stdout=self.stdout)
+        if not options['no_rebuild']:
+            call_command('rebuild_follow_feed', stdout=self.stdout)
+
+    def check_prefix(self, prefix):
+        """Не даёт второй раз создать данные с тем же --prefix: имена
+        пользователей и slug групп уникальны."""
+        pattern = re.escape(prefix)
+        if (
+            User.objects.filter(username__regex=rf'^{pattern}[0-9]+$')
+            .exists()
+            or Group.objects.filter(slug__regex=rf'^{pattern}-[0-9]+$')
+            .exists()
+        ):
+            raise CommandError(
+                f'Данные с префиксом {prefix!r} уже есть: удалите их или '
+                'укажите другой --prefix.'
+            )
+
+    def insert(self, model, rows, count, ignore_conflicts=False):
+        """Вставляет count строк из rows — словарей поле → значение,
+        уже приведённое к виду базы, — пачками через executemany, каждая
+        пачка в своей транзакции или точке сохранения. id выдаются
+        подряд после последнего в таблице и возвращаются."""
+        first_id = (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        ids = range(first_id, first_id + count)
+        rows = islice(rows, count)
+        first = next(rows, None)
+        if first is None:
+            return ids
+        fields = [model._meta.pk]
+        fields += [model._meta.get_field(name) for name in first]
+        ops = connection.ops
+        sql = '{} {} ({}) VALUES ({}) {}'.format(
+            ops.insert_statement(ignore_conflicts=ignore_conflicts),
+            ops.quote_name(model._meta.db_table),
+            ', '.join(ops.quote_name(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)),
+            ops.ignore_conflicts_suffix_sql(ignore_conflicts=ignore_conflicts),
+        )
+        name = model._meta.label
+        rows = (
+            [pk, *row.values()] for pk, row in zip(ids, chain([first], rows))
+        )
+        inserted = 0
+        started = time.monotonic()
+        while True:
+            batch = list(islice(rows, self.options['batch_size']))
+            if not batch:
+                break
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, batch)
+            inserted += len(batch)
+            elapsed = max(time.monotonic() - started, 0.001)
+            self.stdout.write(
+                f'{name}: {inserted} строк, {inserted / elapsed:.0f} строк/с'
+            )
+        return ids
+
+    def pick_users(self, count):
+        """count пользователей по степенному закону популярности."""
+        return self.random.choices(
+            self.popular, cum_weights=self.weights, k=count
+        )
+
+    def text(self):
+        return ' '.join(self.random.choices(
+            self.sentences, k=self.random.randint(1, 6)
+        ))
+
+    def user_rows(self):
+        prefix = self.options['prefix']
+        date_joined = self.adapt(self.start)
+        for number in range(self.options['users']):
+            yield {
+                'username': f'{prefix}{number}',
+                'first_name': self.random.choice(self.first_names),
+                'last_name': self.random.choice(self.last_names),
+                'email': f'{prefix}{number}@example.com',
+                # Пароль с '!' в начале не подходит ни к одному вводу.
+                'password': '!',
+                'is_superuser': False,
+                'is_staff': False,
+                'is_active': True,
+                'date_joined': date_joined,
+            }
+
+    def group_rows(self):
+        prefix = self.options['prefix']
+        for number in range(self.options['groups']):
+            yield {
+                'title': self.random.choice(self.sentences)[:200],
+                'slug': f'{prefix}-{number}',
+                'description': self.text(),
+                'posts_count': 0,
+            }
+
+    def create_images(self):
+        """Картинки для постов: имя в хранилище, размеры и заглушка."""
+        storage = Post._meta.get_field('image').storage
+        images = []
+        for number in range(self.options['images']):
+            width = self.random.randrange(320, 1600, 8)
+            height = self.random.randrange(240, 1200, 8)
+            image = Image.new('RGB', (width, height), self.color())
+            draw = ImageDraw.Draw(image)
+            for _ in range(8):
+                x = self.random.randrange(width)
+                y = self.random.randrange(height)
+                draw.ellipse(
+                    (x, y, x + width // 4, y + height // 4), fill=self.color()
+                )
+            buffer = BytesIO()
+            image.save(buffer, 'JPEG', quality=85)
+            name = storage.save(
+                f'posts/synthetic_{number}.jpg', ContentFile(buffer.getvalue())
+            )
+            buffer.seek(0)
+            images.append((name, *read_image_metadata(buffer)))
+        return images
+
+    def color(self):
+        return tuple(self.random.randrange(256) for _ in range(3))
+
+    def post_date(self, index):
+        """Дата поста с порядковым номером index: посты равномерно
+        распределены по --days дням, более поздние — с большими id."""
+        return self.start + self.span * index / max(self.options['posts'], 1)
+
+    def post_rows(self):
+        ratio = self.options['image_ratio']
+        authors = iter(())
+        for index in range(self.options['posts']):
+            if not index % self.options['batch_size']:
+                authors = iter(self.pick_users(self.options['batch_size']))
+            pub_date = self.adapt(self.post_date(index))
+            image = ('', None, None, '')
+            if self.images and self.random.random() < ratio:
+                image = self.random.choice(self.images)
+            group_id = None
+            if self.group_ids and self.random.random() < 0.7:
+                group_id = self.random.choice(self.group_ids)
+            yield {
+                'text': self.text(),
+                'pub_date': pub_date,
+                'updated': pub_date,
+                'author': next(authors),
+                'group': group_id,
+                'image': image[0],
+                'image_width': image[1],
+                'image_height': image[2],
+                'image_placeholder': image[3],
+                'comments_count': 0,
+            }
+
+    def comment_rows(self):
+        if not self.post_ids:
+            return
+        # Популярные посты — ранние по рангу: первые посты в списке
+        # получают больше всего комментариев.
+        positions = range(len(self.post_ids))
+        for _ in range(self.options['comments']):
+            position, = self.random.choices(
+                positions, cum_weights=self.post_weights
+            )
+            created = self.post_date(position) + datetime.timedelta(
+                seconds=self.random.randrange(24 * 60 * 60)
+            )
+            yield {
+                'post': self.post_ids[position],
+                'author': self.random.choice(self.user_ids),
+                'text': self.text(),
+                'created': self.adapt(created),
+            }
+
+    def follow_rows(self):
+        if len(self.user_ids) < 2:
+            return
+        for _ in range(self.options['follows']):
+            user_id = self.random.choice(self.user_ids)
+            author_id, = self.pick_users(1)
+            if author_id != user_id:
+                yield {'user': user_id, 'author': author_id}
@@ -0,0 +1,409 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts.generations import bump_generations
+from posts.images import ingest_image, read_image_metadata
+from posts.models import Comment, Follow, Group, ImportedId, Post
+
+User = get_user_model()
+
+# Порядок импорта: внешние ключи ссылаются только на уже загруженное.
+KINDS = ('users', 'groups', 'posts', 'comments', 'follows')
+
+
+def read_rows(path):
+    """Строки файла JSONL или CSV как словари, по одной."""
+    with open(path, newline='', encoding='utf-8') as source:
+        if path.endswith('.csv'):
+            yield from csv.DictReader(source)
+            return
+        for line in source:
+            if line.strip():
+                yield json.loads(line)
+
+
+def parse_date(value):
+    """Дата из выгрузки; без часового пояса считается в TIME_ZONE."""
+    value = parse_datetime(value) if value else None
+    if value is None:
+        return timezone.now()
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def source_id(value):
+    """Id из выгрузки строкой: в CSV это строки, в JSONL — числа."""
+    return '' if value is None else str(value)
+
+
+def describe(row):
+    """Как назвать строку выгрузки в сообщении: по id, а без него —
+    целиком."""
+    if source_id(row.get('id')):
+        return f'id {row["id"]}'
+    return json.dumps(row, ensure_ascii=False, default=str)
+
+
+def lock_for_insert(model):
+    """Блокирует запись в таблицу model до конца транзакции, чтобы id,
+    выданные после Max(pk), не заняла параллельная вставка."""
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE')
+        else:
+            # SQLite блокирует всю базу на запись с первой пишущей
+            # командой транзакции, даже если она не меняет ни строки.
+            pk = connection.ops.quote_name(model._meta.pk.column)
+            cursor.execute(f'UPDATE {table} SET {pk} = {pk} WHERE 1 = 0')
+
+
+@contextmanager
+def keep_dates(*fields):
+    """Отключает auto_now и auto_now_add, чтобы bulk_create сохранил
+    даты из выгрузки."""
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now = auto_now
+            field.auto_now_add = auto_now_add
+
+
+class Command(BaseCommand):
+    help = ('Импортирует пользователей, группы, посты, комментарии и '
+            'подписки из JSONL или CSV. Записи вставляются bulk_create '
+            'в больших транзакциях; прерванный импорт продолжается с места '
+            'остановки повторным запуском с теми же файлами.')
+
+    def add_arguments(self, parser):
+        for kind in KINDS:
+            parser.add_argument(f'--{kind}', metavar='FILE')
+        parser.add_argument(
+            '--media-source',
+            help='Каталог, относительно которого указаны картинки постов',
+        )
+        parser.add_argument(
+            '--batch-size', type=int,
+            help='Строк в одном INSERT; не больше предела базы',
+        )
+        parser.add_argument(
+            '--transaction-size', type=int, default=20000,
+            help='Строк в одной транзакции',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='Потоков для копирования картинок',
+        )
+        parser.add_argument(
+            '--no-rebuild', action='store_true',
+            help='Не пересчитывать счётчики, хештеги и ленты после импорта',
+        )
+
+    def handle(self, *args, **options):
+        if not any(options[kind] for kind in KINDS):
+            raise CommandError(
+                'Укажите хотя бы один файл: '
+                + ', '.join(f'--{kind}' for kind in KINDS)
+            )
+        self.options = options
+        self.maps = {}
+        # Ленты, закешированные до импорта: главная, группы и профили
+        # пользователей, которые уже были в базе.
+        self.scopes = {'index'}
+        self.existing_users = set()
+        self.executor = ThreadPoolExecutor(max_workers=options['workers'])
+        importers = {
+            'users': self.build_users,
+            'groups': self.build_groups,
+            'posts': self.build_posts,
+            'comments': self.build_comments,
+            'follows': self.build_follows,
+        }
+        try:
+            with keep_dates(
+                Post._meta.get_field('pub_date'),
+                Post._meta.get_field('updated'),
+                Comment._meta.get_field('created'),
+            ):
+                for kind in KINDS:
+                    if options[kind]:
+                        self.import_file(kind, options[kind], importers[kind])
+        finally:
+            self.executor.shutdown()
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                no_style(), [User, Group, Post, Comment]
+            ):
+                cursor.execute(sql)
+        bump_generations(sorted(self.scopes))
+        if not options['no_rebuild']:
+            for command in ('recount_counters', 'rebuild_tags',
+                            'rebuild_follow_feed'):
+                call_command(command, stdout=self.stdout)
+
+    def id_map(self, kind):
+        """Соответствие id выгрузки и базы для kind, загруженное один
+        раз."""
+        if kind not in self.maps:
+            self.maps[kind] = dict(
+                ImportedId.objects.filter(kind=kind).values_list(
+                    'source_id', 'target_id'
+                ).iterator()
+            )
+        return self.maps[kind]
+
+    def import_file(self, kind, path, build):
+        rows = read_rows(path)
+        imported = skipped = 0
+        started = time.monotonic()
+        while True:
+            chunk = list(islice(rows, self.options['transaction_size']))
+            if not chunk:
+                break
+            with transaction.atomic():
+                done, missing = build(chunk)
+            imported += done
+            skipped += missing
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'{kind}: {imported} строк, '
+                f'{imported / max(elapsed, 0.001):.0f} строк/с'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'{kind}: импортировано {imported}, пропущено {skipped} '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
+
+    def bulk_insert(self, model, objects, **kwargs):
+        """bulk_create пачками по --batch-size, но не больше, чем база
+        принимает параметров в одном запросе."""
+        if not objects:
+            return
+        limit = connection.ops.bulk_batch_size(
+            model._meta.concrete_fields, objects
+        )
+        batch_size = min(self.options['batch_size'] or limit, limit)
+        model.objects.bulk_create(objects, batch_size=batch_size, **kwargs)
+
+    def insert_mapped(self, kind, model, pending):
+        """Вставляет новые записи с заранее выданными id и запоминает
+        их соответствие id выгрузки. pending — пары (id выгрузки,
+        объект без id).
+
+        id выдаются под блокировкой таблицы, которая держится до конца
+        транзакции пачки."""
+        if not pending:
+            return
+        id_map = self.id_map(kind)
+        lock_for_insert(model)
+        next_id = (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        mapped = []
+        for offset, (source, obj) in enumerate(pending):
+            obj.pk = next_id + offset
+            mapped.append(
+                ImportedId(kind=kind, source_id=source, target_id=obj.pk)
+            )
+        self.bulk_insert(model, [obj for _, obj in pending])
+        self.bulk_insert(ImportedId, mapped)
+        id_map.update((row.source_id, row.target_id) for row in mapped)
+
+    def reject(self, kind, row, reason):
+        """Сообщает о строке, которую нельзя импортировать."""
+        self.stderr.write(
+            f'{kind}: строка {describe(row)} пропущена: {reason}'
+        )
+
+    def check_row(self, kind, row, **fields):
+        """Проверяет, что в строке заполнены поля fields, а ссылки в них
+        есть в переданных соответствиях id (None — поле без ссылки).
+        О плохой строке сообщает и возвращает False."""
+        for name, id_map in fields.items():
+            value = row.get(name)
+            if value is None or value == '':
+                self.reject(kind, row, f'не заполнено поле {name}')
+                return False
+            if id_map is not None and source_id(value) not in id_map:
+                self.reject(kind, row, f'{name} {value} не импортирован')
+                return False
+        return True
+
+    def new_rows(self, kind, chunk):
+        """Строки, которых ещё нет в базе после прошлых запусков."""
+        id_map = self.id_map(kind)
+        seen = set()
+        for row in chunk:
+            source = source_id(row.get('id'))
+            if source not in id_map and source not in seen:
+                seen.add(source)
+                yield source, row
+
+    def build_users(self, chunk):
+        existing = []
+        pending = []
+        rows = [
+            (source, row) for source, row in self.new_rows('users', chunk)
+            if self.check_row('users', row, username=None)
+        ]
+        names = dict(User.objects.filter(
+            username__in=[row['username'] for _, row in rows]
+        ).values_list('username', 'id'))
+        for source, row in rows:
+            if row['username'] in names:
+                existing.append(ImportedId(
+                    kind='users', source_id=source,
+                    target_id=names[row['username']],
+                ))
+                continue
+            pending.append((source, User(
+                username=row['username'],
+                email=row.get('email') or '',
+                first_name=row.get('first_name') or '',
+                last_name=row.get('last_name') or '',
+                password=make_password(None),
+            )))
+        self.bulk_insert(ImportedId, existing)
+        self.id_map('users').update(
+            (row.source_id, row.target_id) for row in existing
+        )
+        self.existing_users.update(row.target_id for row in existing)
+        self.insert_mapped('users', User, pending)
+        return len(rows), len(chunk) - len(rows)
+
+    def build_groups(self, chunk):
+        existing = []
+        pending = []
+        rows = [
+            (source, row) for source, row in self.new_rows('groups', chunk)
+            if self.check_row('groups', row, title=None, slug=None)
+        ]
+        slugs = dict(Group.objects.filter(
+            slug__in=[row['slug'] for _, row in rows]
+        ).values_list('slug', 'id'))
+        for source, row in rows:
+            if row['slug'] in slugs:
+                existing.append(ImportedId(
+                    kind='groups', source_id=source,
+                    target_id=slugs[row['slug']],
+                ))
+                continue
+            pending.append((source, Group(
+                title=row['title'],
+                slug=row['slug'],
+                description=row.get('description') or '',
+            )))
+        self.bulk_insert(ImportedId, existing)
+        self.id_map('groups').update(
+            (row.source_id, row.target_id) for row in existing
+        )
+        self.insert_mapped('groups', Group, pending)
+        return len(rows), len(chunk) - len(rows)
+
+    def copy_image(self, path):
+        """Копирует картинку поста в хранилище так же, как загрузку
+        через форму. Возвращает имя файла и метаданные или None."""
+        if not path:
+            return None
+        source = os.path.join(self.options['media_source'] or '', path)
+        field = Post._meta.get_field('image')
+        try:
+            with open(source, 'rb') as original:
+                image = ingest_image(File(original, os.path.basename(path)))
+                name = field.storage.save(
+                    field.generate_filename(None, image.name), image
+                )
+                image.seek(0)
+                return (name, *read_image_metadata(image))
+        except (OSError, ValidationError) as error:
+            self.stderr.write(f'Картинка {path} пропущена: {error}')
+            return None
+
+    def build_posts(self, chunk):
+        users = self.id_map('users')
+        groups = self.id_map('groups')
+        rows = [
+            (source, row) for source, row in self.new_rows('posts', chunk)
+            if self.check_row('posts', row, author=users, text=None)
+        ]
+        images = self.executor.map(
+            self.copy_image, [row.get('image') or '' for _, row in rows]
+        )
+        pending = []
+        for (source, row), image in zip(rows, images):
+            pub_date = parse_date(row.get('pub_date'))
+            post = Post(
+                author_id=users[source_id(row['author'])],
+                group_id=groups.get(source_id(row.get('group'))),
+                text=row['text'],
+                pub_date=pub_date,
+                updated=pub_date,
+            )
+            if image:
+                (post.image, post.image_width, post.image_height,
+                 post.image_placeholder) = image
+            if post.group_id:
+                self.scopes.add(f'group:{post.group_id}')
+            if post.author_id in self.existing_users:
+                self.scopes.add(f'author:{post.author_id}')
+            pending.append((source, post))
+        self.insert_mapped('posts', Post, pending)
+        return len(rows), len(chunk) - len(rows)
+
+    def build_comments(self, chunk):
+        users = self.id_map('users')
+        posts = self.id_map('posts')
+        pending = [
+            (source, Comment(
+                post_id=posts[source_id(row['post'])],
+                author_id=users[source_id(row['author'])],
+                text=row['text'],
+                created=parse_date(row.get('created')),
+            ))
+            for source, row in self.new_rows('comments', chunk)
+            if self.check_row(
+                'comments', row, post=posts, author=users, text=None
+            )
+        ]
+        self.insert_mapped('comments', Comment, pending)
+        return len(pending), len(chunk) - len(pending)
+
+    def build_follows(self, chunk):
+        users = self.id_map('users')
+        follows = []
+        for row in chunk:
+            if not self.check_row('follows', row, user=users, author=users):
+                continue
+            follow = Follow(
+                user_id=users[source_id(row['user'])],
+                author_id=users[source_id(row['author'])],
+            )
+            # Как и profile_follow, подписку на себя не создаём.
+            if follow.user_id == follow.author_id:
+                self.reject('follows', row, 'подписка на самого себя')
+                continue
+            follows.append(follow)
+        # Повторный запуск вставит те же подписки: уникальность пар
+        # отбрасывает их без ошибки.
+        self.bulk_insert(Follow, follows, ignore_conflicts=True)
+        return len(follows), len(chunk) - len(follows)
@@ -0,0 +1,46 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import generate_thumbnails_safely
+
+
+class Command(BaseCommand):
+    help = ('Создаёт недостающие миниатюры POST_THUMBNAILS для картинок '
+            'существующих постов в пуле процессов')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=multiprocessing.cpu_count()
+        )
+        parser.add_argument('--chunk-size', type=int, default=20)
+
+    def handle(self, *args, **options):
+        images = Post.objects.exclude(image='').order_by().values_list(
+            'image', flat=True
+        ).distinct()
+        started = time.monotonic()
+        done = failed = 0
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        ) as pool:
+            results = pool.map(
+                generate_thumbnails_safely,
+                images.iterator(),
+                chunksize=options['chunk_size'],
+            )
+            for ok in results:
+                done += 1
+                failed += not ok
+                if done % 1000 == 0:
+                    self.stdout.write(f'Обработано картинок: {done}')
+        self.stdout.write(
+            f'Обработано картинок: {done}, с ошибками: {failed}, '
+            f'за {time.monotonic() - started:.1f} с'
+        )
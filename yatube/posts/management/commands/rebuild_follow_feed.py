@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.feeds import rebuild_feeds
+from posts.models import FeedEntry
+
+
+class Command(BaseCommand):
+    help = 'Заново заполняет ленты подписок для движка "push"'
+
+    def handle(self, *args, **options):
+        rebuild_feeds()
+        self.stdout.write(
+            f'Записей в лентах подписок: {FeedEntry.objects.count()}'
+        )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import Comment, Mention, Post, PostTag
+from posts.tags import sync_mentions, sync_post_tags
+
+
+class Command(BaseCommand):
+    help = ('Заново извлекает хештеги и упоминания из текстов постов '
+            'и комментариев')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        posts = Post.objects.only('id', 'text', 'author', 'pub_date', 'group')
+        comments = Comment.objects.select_related('post').only(
+            'id', 'text', 'author', 'created',
+            'post__id', 'post__pub_date', 'post__group'
+        )
+        with transaction.atomic():
+            for post in posts.iterator(chunk_size=chunk_size):
+                sync_post_tags(post)
+                sync_mentions(post)
+            for comment in comments.iterator(chunk_size=chunk_size):
+                sync_mentions(comment.post, comment)
+        self.stdout.write(
+            f'Хештегов постов: {PostTag.objects.count()}, '
+            f'упоминаний: {Mention.objects.count()}'
+        )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.counters import recount
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики постов, комментариев и подписок '
+            'и исправляет расхождения')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать число расхождений',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drift = recount(dry_run=options['dry_run'])
+        for counter, count in drift.items():
+            self.stdout.write(f'{counter}: расхождений {count}')
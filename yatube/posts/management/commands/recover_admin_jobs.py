@@ -0,0 +1,47 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.jobs import run_job, stale_jobs
+from posts.models import AdminJob
+
+
+class Command(BaseCommand):
+    help = ('Находит задания админки, брошенные перезапуском сервера, '
+            'и выполняет их заново в этом процессе или, с --fail, '
+            'отмечает ошибкой. Задания повторяемы: уже обработанные '
+            'записи они пропускают.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stale-after', type=int, default=settings.ADMIN_JOB_STALE_AFTER,
+            help='Секунд без новой пачки, после которых задание брошено',
+        )
+        parser.add_argument(
+            '--fail', action='store_true',
+            help='Отметить брошенные задания ошибкой, а не выполнять',
+        )
+
+    def handle(self, *args, **options):
+        stale = stale_jobs(datetime.timedelta(seconds=options['stale_after']))
+        if options['fail']:
+            count = stale.update(
+                status=AdminJob.FAILED,
+                error='Задание брошено остановленным процессом',
+                finished=timezone.now(),
+            )
+            self.stdout.write(f'Отмечено ошибкой заданий: {count}')
+            return
+        pks = list(stale.values_list('pk', flat=True))
+        # Выполняемые задания возвращаются в очередь только если за это
+        # время их не отметил heartbeat живого процесса.
+        stale.filter(pk__in=pks, status=AdminJob.RUNNING).update(
+            status=AdminJob.QUEUED
+        )
+        for pk in pks:
+            done = run_job(pk)
+            self.stdout.write(
+                f'Задание {pk}: {"выполнено" if done else "не выполнено"}'
+            )
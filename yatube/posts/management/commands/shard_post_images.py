@@ -0,0 +1,91 @@
+import os
+import shutil
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов в хранилище с именами по '
+            'содержимому и обновляет пути в базе пачками')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать картинки, которые нужно перенести',
+        )
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        rows = Post.objects.exclude(image='').order_by('image').values_list(
+            'id', 'image'
+        )
+        started = time.monotonic()
+        names = {}
+        batch = []
+        moved = missing = 0
+        for post_id, name in rows.iterator(chunk_size=options['batch_size']):
+            if storage.is_content_name(name):
+                continue
+            if name not in names:
+                names[name] = self.place(storage, name, options['dry_run'])
+                if names[name] is None:
+                    missing += 1
+                else:
+                    moved += 1
+            if names[name] is not None:
+                batch.append(Post(id=post_id, image=names[name]))
+            if len(batch) >= options['batch_size']:
+                self.flush(storage, batch, names, options['dry_run'])
+                batch = []
+                # Имена из прошлых пачек больше не встретятся: строки
+                # отсортированы по пути.
+                names = {name: names[name]}
+        self.flush(storage, batch, names, options['dry_run'])
+        verb = 'Нужно перенести' if options['dry_run'] else 'Перенесено'
+        self.stdout.write(
+            f'{verb} файлов: {moved}, не найдено: {missing}, '
+            f'за {time.monotonic() - started:.1f} с'
+        )
+
+    def place(self, storage, name, dry_run):
+        """Кладёт копию файла под имя по содержимому и возвращает это
+        имя; старый файл остаётся, пока на него ссылаются посты."""
+        if not storage.exists(name):
+            self.stderr.write(f'Файл не найден: {name}')
+            return None
+        with storage.open(name) as content:
+            target = storage.content_name(name, content)
+            if dry_run or storage.exists(target):
+                return target
+            path = storage.path(target)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.link(storage.path(name), path)
+            except OSError:
+                shutil.copyfile(storage.path(name), path)
+        return target
+
+    def flush(self, storage, batch, names, dry_run):
+        if dry_run or not batch:
+            return
+        with transaction.atomic():
+            for post in batch:
+                # Новая дата изменения сбрасывает карточки со старыми
+                # адресами картинок.
+                post.updated = timezone.now()
+            Post.objects.bulk_update(batch, ('image', 'updated'))
+        referenced = set(
+            Post.objects.filter(image__in=list(names)).values_list(
+                'image', flat=True
+            )
+        )
+        for name in names:
+            if names[name] is not None and name not in referenced:
+                storage.delete(name)
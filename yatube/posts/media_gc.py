@@ -0,0 +1,144 @@
+import heapq
+import itertools
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from .models import Post
+from .thumbnails import planned_backend, thumbnail_variants
+
+
+def external_sort(names, chunk_size):
+    """Сортирует поток строк, держа в памяти не больше chunk_size:
+    отсортированные куски пишутся во временные файлы и сливаются."""
+    runs = []
+    try:
+        while True:
+            chunk = sorted(itertools.islice(names, chunk_size))
+            if not chunk:
+                break
+            run = tempfile.TemporaryFile('w+', encoding='utf-8')
+            run.writelines(f'{name}\n' for name in chunk)
+            run.seek(0)
+            runs.append(run)
+        yield from heapq.merge(
+            *((line.rstrip('\n') for line in run) for run in runs)
+        )
+    finally:
+        for run in runs:
+            run.close()
+
+
+def media_directories():
+    """Каталоги MEDIA_ROOT, которые принадлежат картинкам постов:
+    оригиналы и миниатюры sorl."""
+    upload_to = Post._meta.get_field('image').upload_to
+    return [upload_to.strip('/'), sorl_settings.THUMBNAIL_PREFIX.strip('/')]
+
+
+def walk_media(root, directories):
+    """Перебирает файлы каталогов рекурсивно через os.scandir и
+    возвращает пути относительно root через '/'."""
+    stack = [os.path.join(root, directory) for directory in directories]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    name = os.path.relpath(entry.path, root)
+                    name = name.replace(os.sep, '/')
+                    # Такое имя не переживёт построчную сортировку;
+                    # картинки постов так не называются.
+                    if '\n' not in name:
+                        yield name
+
+
+def thumbnail_names(image):
+    """Имена всех миниатюр, которые шаблоны могут запросить для
+    картинки image, включая альтернативные разрешения sorl."""
+    for name in settings.POST_THUMBNAILS:
+        for _, _, geometry, options in thumbnail_variants(name):
+            thumbnail = planned_backend.thumbnail_file(
+                image, geometry, **options
+            ).name
+            yield thumbnail
+            stem, extension = os.path.splitext(thumbnail)
+            for resolution in sorl_settings.THUMBNAIL_ALTERNATIVE_RESOLUTIONS:
+                yield f'{stem}@{resolution}x{extension}'
+
+
+def referenced_media(chunk_size):
+    """Имена картинок постов и их миниатюр, прочитанные из базы
+    потоком."""
+    images = Post.objects.exclude(image='').order_by().values_list(
+        'image', flat=True
+    )
+    for image in images.iterator(chunk_size=chunk_size):
+        yield image
+        yield from thumbnail_names(image)
+
+
+def find_orphans(files, referenced):
+    """Сливает два отсортированных потока имён и возвращает файлы,
+    на которые ничто не ссылается. В referenced допустимы повторы."""
+    referenced = iter(referenced)
+    current = next(referenced, None)
+    for name in files:
+        while current is not None and current < name:
+            current = next(referenced, None)
+        if name != current:
+            yield name
+
+
+class RateLimiter:
+    """Не пропускает больше rate операций в секунду; 0 — без
+    ограничения."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+        self.next_at = max(now, self.next_at) + self.interval
+
+
+def find_orphaned_media(root, chunk_size):
+    """Возвращает в порядке сортировки файлы картинок постов и миниатюр
+    под root, на которые не ссылается ни один пост."""
+    files = external_sort(walk_media(root, media_directories()), chunk_size)
+    referenced = external_sort(referenced_media(chunk_size), chunk_size)
+    return find_orphans(files, referenced)
+
+
+def remove_media(root, name, quarantine=None):
+    """Удаляет файл или переносит его в каталог quarantine с тем же
+    относительным путём, и забывает его в kvstore sorl."""
+    path = os.path.join(root, name)
+    if quarantine:
+        target = os.path.join(quarantine, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(path, target)
+    else:
+        os.remove(path)
+    storage = (
+        default.storage
+        if name.startswith(sorl_settings.THUMBNAIL_PREFIX)
+        else Post._meta.get_field('image').storage
+    )
+    default.kvstore.delete(ImageFile(name, storage), delete_thumbnails=False)
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def create_indexes(apps, schema_editor):
+    from posts.search import ensure_search_indexes
+    ensure_search_indexes(schema_editor.connection)
+
+
+def drop_indexes(apps, schema_editor):
+    from posts.search import drop_search_indexes
+    drop_search_indexes(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_post_image_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
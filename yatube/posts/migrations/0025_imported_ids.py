@@ -0,0 +1,26 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0024_admin_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportedId',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20, verbose_name='Вид записей')),
+                ('source_id', models.CharField(max_length=64, verbose_name='Id в выгрузке')),
+                ('target_id', models.PositiveIntegerField(verbose_name='Id в базе')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='importedid',
+            constraint=models.UniqueConstraint(fields=('kind', 'source_id'), name='unique_imported_id'),
+        ),
+    ]
@@ -0,0 +1,97 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations
+
+from posts.tags import extract_mentions, extract_tags
+
+# Небольшие пачки: имена тегов и пользователей попадают в IN (...).
+CHUNK_SIZE = 200
+
+
+def chunks(rows):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, CHUNK_SIZE))
+        if not chunk:
+            return
+        yield chunk
+
+
+def backfill_tags(apps, schema_editor):
+    """Хештеги и упоминания постов и комментариев, созданных до 0022.
+
+    Правила разбора те же, что у sync_post_tags и sync_mentions, но
+    строки пишутся пачками через модели миграции, как в rebuild_tags
+    после записи в обход сигналов.
+    """
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Tag = apps.get_model('posts', 'Tag')
+    PostTag = apps.get_model('posts', 'PostTag')
+    Mention = apps.get_model('posts', 'Mention')
+    # Упоминания не уникальны: заполняются заново, даже если
+    # rebuild_tags уже запускали вручную.
+    Mention.objects.all().delete()
+
+    def mentions(rows):
+        """Упоминания для строк (автор, текст, пост, комментарий, дата)."""
+        found = [extract_mentions(row[1]) for row in rows]
+        users = dict(User.objects.filter(
+            username__in={name for names in found for name in names}
+        ).values_list('username', 'id'))
+        return [
+            Mention(user_id=users[name], post_id=post_id,
+                    comment_id=comment_id, created=created)
+            for (author_id, _, post_id, comment_id, created), names
+            in zip(rows, found)
+            for name in names
+            if users.get(name, author_id) != author_id
+        ]
+
+    posts = Post.objects.order_by('pk').values_list(
+        'id', 'author_id', 'text', 'pub_date'
+    )
+    for chunk in chunks(posts.iterator(chunk_size=CHUNK_SIZE)):
+        tags = {row[0]: extract_tags(row[2]) for row in chunk}
+        names = {name for found in tags.values() for name in found}
+        Tag.objects.bulk_create(
+            [Tag(name=name) for name in names], ignore_conflicts=True
+        )
+        tag_ids = dict(
+            Tag.objects.filter(name__in=names).values_list('name', 'id')
+        )
+        PostTag.objects.bulk_create(
+            [
+                PostTag(post_id=post_id, tag_id=tag_ids[name],
+                        pub_date=pub_date)
+                for post_id, _, _, pub_date in chunk
+                for name in tags[post_id]
+            ],
+            ignore_conflicts=True,
+        )
+        Mention.objects.bulk_create(mentions([
+            (author_id, text, post_id, None, pub_date)
+            for post_id, author_id, text, pub_date in chunk
+        ]))
+
+    comments = Comment.objects.order_by('pk').values_list(
+        'id', 'author_id', 'text', 'post_id', 'created'
+    )
+    for chunk in chunks(comments.iterator(chunk_size=CHUNK_SIZE)):
+        Mention.objects.bulk_create(mentions([
+            (author_id, text, post_id, comment_id, created)
+            for comment_id, author_id, text, post_id, created in chunk
+        ]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0025_imported_ids'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0026_backfill_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adminjob',
+            name='heartbeat',
+            field=models.DateTimeField(blank=True, help_text='Отметка выполняемого задания после каждой пачки', null=True, verbose_name='Последняя пачка'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from core.storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
@@ -8,6 +10,7 @@ class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
     description = models.TextField()
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
 
     def __str__(self):
         return self.title
@@ -23,6 +26,7 @@ class Post(models.Model):
         auto_now_add=True,
         db_index=True,
     )
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -41,15 +45,44 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True,
         help_text='Изображение, которое будет относиться к посту',
     )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки', null=True, blank=True
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки', null=True, blank=True
+    )
+    image_placeholder = models.TextField(
+        'Заглушка картинки',
+        blank=True,
+        help_text='Крошечная копия картинки в виде data URI',
+    )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+    )
 
     def __str__(self):
         return self.text[:15]
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='post_feed_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_feed_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_feed_idx'
+            ),
+        ]
 
 
 class Comment(models.Model):
@@ -73,6 +106,14 @@ class Comment(models.Model):
 
     class Meta:
         default_related_name = 'comments'
+        indexes = [
+            models.Index(
+                fields=['post', 'created', 'id'], name='comment_thread_idx'
+            ),
+            models.Index(
+                fields=['-created', '-id'], name='comment_created_idx'
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -98,3 +139,212 @@ class Follow(models.Model):
                 fields=['user', 'author'], name='unique_author_user_following'
             )
         ]
+
+
+class FeedEntry(models.Model):
+    """Запись в ленте подписок пользователя.
+
+    Заполняется при публикации поста для всех подписчиков автора,
+    поэтому лента подписок читается одним диапазоном по индексу.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Подписчик'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор постов'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пост'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_entry_user_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'], name='feed_entry_author_idx'
+            ),
+        ]
+
+
+class Tag(models.Model):
+    name = models.CharField('Название', max_length=100, unique=True)
+
+    def __str__(self):
+        return f'#{self.name}'
+
+
+class PostTag(models.Model):
+    """Хештег поста.
+
+    Извлекается из текста при сохранении поста; дата публикации
+    повторяется здесь, чтобы лента тега читалась одним диапазоном
+    по индексу.
+    """
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='post_tags',
+        verbose_name='Пост'
+    )
+    tag = models.ForeignKey(
+        Tag,
+        on_delete=models.CASCADE,
+        related_name='post_tags',
+        verbose_name='Тег'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'tag'], name='unique_post_tag'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['tag', '-pub_date', '-post'], name='post_tag_feed_idx'
+            ),
+        ]
+
+
+class Mention(models.Model):
+    """Упоминание пользователя через @username в посте или комментарии.
+
+    Извлекается из текста при сохранении, чтобы уведомления об
+    упоминаниях читались по индексу без разбора текстов.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='mentions',
+        verbose_name='Упомянутый пользователь'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='mentions',
+        verbose_name='Пост'
+    )
+    comment = models.ForeignKey(
+        Comment,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name='mentions',
+        verbose_name='Комментарий'
+    )
+    created = models.DateTimeField('Дата упоминания')
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-created', '-id'], name='mention_user_idx'
+            ),
+        ]
+
+
+class UserCounter(models.Model):
+    """Счётчики постов и подписок пользователя.
+
+    Обновляются вместе с постами и подписками, чтобы профиль и страница
+    поста не считали их запросами COUNT.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counters',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков', default=0
+    )
+    following_count = models.PositiveIntegerField('Число подписок', default=0)
+
+
+class AdminJob(models.Model):
+    """Фоновая операция над многими записями, запущенная из админки.
+
+    Выполняется пачками; processed растёт после каждой пачки, поэтому
+    ход работы виден в списке заданий.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    action = models.CharField('Действие', max_length=50)
+    description = models.CharField('Описание', max_length=200)
+    arguments = models.TextField('Аргументы в JSON', default='{}')
+    status = models.CharField(
+        'Состояние', max_length=10, choices=STATUS_CHOICES, default=QUEUED
+    )
+    total = models.PositiveIntegerField('Всего записей', default=0)
+    processed = models.PositiveIntegerField('Обработано', default=0)
+    error = models.TextField('Ошибка', blank=True)
+    started_by = models.ForeignKey(
+        User,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        verbose_name='Запустил'
+    )
+    created = models.DateTimeField('Создано', auto_now_add=True)
+    finished = models.DateTimeField('Завершено', null=True, blank=True)
+    heartbeat = models.DateTimeField(
+        'Последняя пачка',
+        null=True,
+        blank=True,
+        help_text='Отметка выполняемого задания после каждой пачки',
+    )
+
+    def __str__(self):
+        return self.description
+
+    class Meta:
+        ordering = ('-created', '-id')
+
+
+class ImportedId(models.Model):
+    """Соответствие id записи в выгрузке старой платформы и id
+    импортированной записи.
+
+    Пишется в одной транзакции с самими записями, поэтому по нему
+    import_content продолжает прерванный импорт и связывает внешние
+    ключи.
+    """
+    kind = models.CharField('Вид записей', max_length=20)
+    source_id = models.CharField('Id в выгрузке', max_length=64)
+    target_id = models.PositiveIntegerField('Id в базе')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'source_id'], name='unique_imported_id'
+            )
+        ]
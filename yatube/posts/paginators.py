@@ -0,0 +1,214 @@
+import base64
+import binascii
+import datetime
+import json
+import math
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+# Типы значений, из которых состоит курсор.
+SCALARS = (str, int, float)
+
+
+class CursorPaginator(Paginator):
+    """Постраничный вывод по ключу (pub_date, id) без COUNT и OFFSET.
+
+    Вместо номера страницы в ссылках передаются непрозрачные курсоры
+    ?after= и ?before=, каждая страница выбирается одним запросом
+    по индексу. Общее число страниц неизвестно: пагинатор знает только
+    о текущей странице и о том, есть ли соседние.
+    """
+
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-id')):
+        super().__init__(object_list.order_by(*ordering), per_page)
+        self.ordering = ordering
+        self.fields = [name.lstrip('-') for name in ordering]
+        self.descending = ordering[0].startswith('-')
+        self.has_next = False
+        self.has_previous = False
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    @property
+    def num_pages(self):
+        return 1 + self.has_previous + self.has_next
+
+    def encode_cursor(self, obj):
+        """Курсор после obj: объекта модели или строки values()."""
+        values = []
+        for name in self.fields:
+            value = obj[name] if isinstance(obj, dict) else getattr(obj, name)
+            values.append(
+                value.isoformat() if hasattr(value, 'isoformat') else value
+            )
+        raw = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Возвращает значения ключа из курсора или None, если курсор
+        отсутствует или повреждён."""
+        if not cursor:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            values = json.loads(raw)
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                return None
+            return [
+                self._to_python(name, value)
+                for name, value in zip(self.fields, values)
+            ]
+        except (binascii.Error, ValueError, TypeError, OverflowError,
+                ValidationError):
+            return None
+
+    def _to_python(self, name, value):
+        """Приводит значение из курсора к типу поля; аннотации вроде
+        ранга поиска допускаются только числовые. Курсор, собранный
+        вручную, не должен доходить до запроса: None, вложенные списки,
+        числа вне диапазона базы и даты без часового пояса отвергаются."""
+        if isinstance(value, bool) or not isinstance(value, SCALARS):
+            raise TypeError(f'Недопустимое значение {name} в курсоре')
+        if isinstance(value, float) and not math.isfinite(value):
+            raise ValueError(f'Недопустимое число {name} в курсоре')
+        if isinstance(value, int) and not -2 ** 63 <= value < 2 ** 63:
+            raise OverflowError(f'Слишком большое число {name} в курсоре')
+        try:
+            field = self.object_list.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            if not isinstance(value, (int, float)):
+                raise ValueError(f'Нечисловое значение {name} в курсоре')
+            return value
+        value = field.to_python(value)
+        if value is None:
+            raise ValueError(f'Пустое значение {name} в курсоре')
+        if isinstance(value, datetime.datetime):
+            if timezone.is_naive(value):
+                raise ValueError(f'Дата {name} в курсоре без часового пояса')
+            # Переполнение при переводе в UTC случится здесь, а не в
+            # запросе.
+            value.astimezone(datetime.timezone.utc)
+        return value
+
+    def _seek(self, values, forward):
+        lookup = 'lt' if self.descending == forward else 'gt'
+        condition = Q()
+        for position, name in enumerate(self.fields):
+            equal = dict(zip(self.fields[:position], values[:position]))
+            equal[f'{name}__{lookup}'] = values[position]
+            condition |= Q(**equal)
+        return condition
+
+    def _reversed_ordering(self):
+        return [
+            name[1:] if name.startswith('-') else f'-{name}'
+            for name in self.ordering
+        ]
+
+    def _fetch(self, values, forward, limit):
+        """Возвращает до limit объектов за курсором values в направлении
+        листания; при листании назад — в обратном порядке."""
+        queryset = self.object_list
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, forward))
+        if not forward:
+            queryset = queryset.order_by(*self._reversed_ordering())
+        return list(queryset[:limit])
+
+    def cursor_page(self, after=None, before=None):
+        """Возвращает страницу после курсора after или перед курсором
+        before; без курсоров — первую страницу."""
+        limit = self.per_page + 1
+        values = self.decode_cursor(before)
+        if values is not None:
+            rows = self._fetch(values, forward=False, limit=limit)
+            if len(rows) < limit:
+                return self.cursor_page()
+            rows = rows[:self.per_page]
+            rows.reverse()
+            self.has_previous = True
+            self.has_next = True
+        else:
+            values = self.decode_cursor(after)
+            rows = self._fetch(values, forward=True, limit=limit)
+            self.has_previous = values is not None
+            self.has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+        if rows and self.has_next:
+            self.next_cursor = self.encode_cursor(rows[-1])
+        if rows and self.has_previous:
+            self.previous_cursor = self.encode_cursor(rows[0])
+        return self._get_page(rows, 1 + self.has_previous, self)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор списков админки без точного COUNT(*).
+
+    Для всей таблицы число записей оценивается сверху по наибольшему
+    первичному ключу, для отфильтрованного списка считается не дальше
+    COUNT_LIMIT записей. Оценка только подписывает список: страницы за
+    ней открываются, пока в них есть записи, а номер за последней
+    записью — например, после удалений — открывает последнюю страницу.
+    """
+    COUNT_LIMIT = 10000
+
+    approximate = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            self.approximate = True
+            return queryset.model._default_manager.aggregate(
+                last=Max('pk')
+            )['last'] or 0
+        count = queryset[:self.COUNT_LIMIT].count()
+        self.approximate = count == self.COUNT_LIMIT
+        return count
+
+    @property
+    def num_pages(self):
+        if self.count == 0 and not self.allow_empty_first_page:
+            return 0
+        return max(1, math.ceil(self.count / self.per_page))
+
+    def validate_number(self, number):
+        """Проверяет только, что номер — целое не меньше 1: с оценкой
+        числа записей он не сверяется."""
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы должен быть целым')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        return number
+
+    def _rows(self, number):
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page + 1
+        return bottom, list(self.object_list[bottom:top])
+
+    def page(self, number):
+        """Страница number; лишняя запись в выборке показывает, есть ли
+        следующая, и уточняет число записей для ссылок на страницы."""
+        number = self.validate_number(number)
+        bottom, rows = self._rows(number)
+        if not rows and number > 1:
+            number = max(1, math.ceil(
+                self.object_list.count() / self.per_page
+            ))
+            bottom, rows = self._rows(number)
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            count = max(self.count, bottom + self.per_page + 1)
+        else:
+            count = bottom + len(rows)
+            self.approximate = False
+        self.__dict__['count'] = count
+        return self._get_page(rows, number, self)
@@ -0,0 +1,140 @@
+import re
+
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+# Полнотекстовые индексы FTS5 над текстами постов и комментариев.
+# Индексы хранят только токены, текст берётся из самих таблиц; триггеры
+# обновляют индекс при любой записи, включая bulk_create и update().
+INDEXES = {
+    'posts_post_fts': 'posts_post',
+    'posts_comment_fts': 'posts_comment',
+}
+
+TABLE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5("
+    "text, content='{table}', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')"
+)
+TRIGGERS_SQL = {
+    '{index}_insert': (
+        'CREATE TRIGGER IF NOT EXISTS {index}_insert AFTER INSERT ON {table} '
+        'BEGIN '
+        'INSERT INTO {index} (rowid, text) VALUES (new.id, new.text); '
+        'END'
+    ),
+    '{index}_delete': (
+        'CREATE TRIGGER IF NOT EXISTS {index}_delete AFTER DELETE ON {table} '
+        'BEGIN '
+        "INSERT INTO {index} ({index}, rowid, text) "
+        "VALUES ('delete', old.id, old.text); "
+        'END'
+    ),
+    '{index}_update': (
+        'CREATE TRIGGER IF NOT EXISTS {index}_update '
+        'AFTER UPDATE OF text ON {table} '
+        'BEGIN '
+        "INSERT INTO {index} ({index}, rowid, text) "
+        "VALUES ('delete', old.id, old.text); "
+        'INSERT INTO {index} (rowid, text) VALUES (new.id, new.text); '
+        'END'
+    ),
+}
+
+WORD = re.compile(r'\w+')
+# Границы совпадений в сниппете: символы из области частного
+# использования не встречаются в текстах и переживают экранирование.
+MATCH_START = '\ue000'
+MATCH_END = '\ue001'
+SNIPPET_TOKENS = 24
+
+
+def ensure_search_indexes(connection):
+    """Создаёт индексы и триггеры, если их нет, и перестраивает индекс,
+    у которого не хватало триггеров.
+
+    SQLite теряет триггеры, когда миграция пересоздаёт таблицу, поэтому
+    функция вызывается и после каждого migrate.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        triggers = {name for name, in cursor.fetchall()}
+        for index, table in INDEXES.items():
+            names = {name.format(index=index) for name in TRIGGERS_SQL}
+            if names <= triggers:
+                continue
+            cursor.execute(TABLE_SQL.format(index=index, table=table))
+            for sql in TRIGGERS_SQL.values():
+                cursor.execute(sql.format(index=index, table=table))
+            cursor.execute(
+                f"INSERT INTO {index} ({index}) VALUES ('rebuild')"
+            )
+
+
+def drop_search_indexes(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for index in INDEXES:
+            for name in TRIGGERS_SQL:
+                cursor.execute(
+                    f'DROP TRIGGER IF EXISTS {name.format(index=index)}'
+                )
+            cursor.execute(f'DROP TABLE IF EXISTS {index}')
+
+
+def match_expression(query):
+    """Превращает поисковую строку в запрос FTS5: все слова должны
+    встретиться, каждое — как начало слова, чтобы находились и другие
+    формы."""
+    return ' '.join(f'"{word}"*' for word in WORD.findall(query))
+
+
+def search(queryset, index, query):
+    """Отбирает из queryset записи, подходящие под query, и добавляет
+    к ним rank (bm25, чем меньше, тем лучше) и snippet."""
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        tables=[index],
+        where=[f'{index}.rowid = {table}.id', f'{index} MATCH %s'],
+        params=[expression],
+    ).annotate(
+        rank=RawSQL(f'bm25({index})', ()),
+        snippet=RawSQL(
+            f"snippet({index}, 0, %s, %s, '…', %s)",
+            (MATCH_START, MATCH_END, SNIPPET_TOKENS),
+        ),
+    )
+
+
+class RowIds(RawSQL):
+    """Подзапрос для фильтра id__in. Django 2.2 сам берёт правую часть
+    IN в скобки, а RawSQL добавляет вторые; SQLite читает IN ((SELECT
+    ...)) как скалярный подзапрос и сравнивает только с первой строкой."""
+
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+def matching_ids(index, query):
+    """Подзапрос id записей, подходящих под query, для фильтра
+    id__in."""
+    return RowIds(
+        f'SELECT rowid FROM {index} WHERE {index} MATCH %s',
+        (match_expression(query),),
+    )
+
+
+def highlight(snippet):
+    """Экранирует сниппет и выделяет совпадения тегом <mark>."""
+    return mark_safe(
+        escape(snippet)
+        .replace(MATCH_START, '<mark>')
+        .replace(MATCH_END, '</mark>')
+    )
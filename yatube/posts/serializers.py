@@ -1,8 +1,54 @@
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Post
 
 
 class PostSerializer(serializers.ModelSerializer):
+    """Пост в API. Необязательный аргумент fields оставляет в выдаче
+    только перечисленные поля."""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     class Meta:
-        fields = ('text', 'author', 'pub_date')
+        fields = ('id', 'text', 'author', 'group', 'pub_date')
         model = Post
+
+
+def datetime_representation(value, tz=None):
+    """Дата так же, как её выводит DateTimeField DRF: ISO 8601
+    в текущем часовом поясе, UTC — с суффиксом Z."""
+    if value is None:
+        return None
+    if timezone.is_aware(value):
+        value = value.astimezone(tz or timezone.get_current_timezone())
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def post_values(queryset, fields=PostSerializer.Meta.fields):
+    """Строки values() для represent_posts. Внешние ключи в values()
+    отдаются id, как и в PostSerializer; id и pub_date выбираются
+    всегда, они нужны курсорам."""
+    return queryset.values(*dict.fromkeys(('id', 'pub_date', *fields)))
+
+
+def represent_posts(rows, fields=PostSerializer.Meta.fields):
+    """Быстрый путь PostSerializer(many=True).data: те же поля в том
+    же виде, но из строк values() без экземпляров моделей и полей
+    DRF."""
+    fields = tuple(fields)
+    has_date = 'pub_date' in fields
+    tz = timezone.get_current_timezone()
+    result = []
+    for row in rows:
+        item = {name: row[name] for name in fields}
+        if has_date:
+            item['pub_date'] = datetime_representation(item['pub_date'], tz)
+        result.append(item)
+    return result
@@ -0,0 +1,201 @@
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import DEFERRED
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from .counters import (change_comment_counter, change_group_counter,
+                       change_user_counter)
+from .feeds import (backfill_feed, fan_out_post, invalidate_timeline,
+                    prune_feed)
+from .generations import bump_generations, post_scopes
+from .images import set_image_metadata
+from .tags import sync_mentions, sync_post_tags
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+# Поля пользователя, которые видны в карточках постов.
+USER_INFO_FIELDS = {'username', 'first_name', 'last_name'}
+# id постов, которые сейчас удаляются в этом потоке: их комментарии
+# удаляются каскадом, и ни счётчик, ни ленты поста для них трогать не
+# нужно — это сделает удаление самого поста.
+deleting = threading.local()
+
+
+def push_feed_enabled():
+    return settings.FOLLOW_FEED_ENGINE == 'push'
+
+
+def deleting_posts():
+    if not hasattr(deleting, 'post_ids'):
+        deleting.post_ids = set()
+    return deleting.post_ids
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    # Отложенное в only() поле не читается: это стоило бы запроса на
+    # каждую строку. Старая группа дочитывается при сохранении.
+    instance._saved_group_id = instance.__dict__.get('group_id', DEFERRED)
+    # Отложенный текст не загружается: такой пост считается изменённым.
+    instance._saved_text = instance.__dict__.get('text')
+
+
+@receiver(pre_save, sender=Post)
+def post_group_loaded(sender, instance, raw=False, **kwargs):
+    if instance._saved_group_id is DEFERRED:
+        instance._saved_group_id = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', flat=True).first()
+
+
+@receiver(pre_save, sender=Post)
+def post_image_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if not instance.image or not instance.image._committed:
+        set_image_metadata(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    bump_generations(post_scopes(instance, instance._saved_group_id))
+    if created:
+        change_user_counter(instance.author_id, posts_count=1)
+        change_group_counter(instance.group_id, 1)
+        invalidate_timeline(instance.author_id)
+        if push_feed_enabled():
+            fan_out_post(instance)
+    elif instance.group_id != instance._saved_group_id:
+        change_group_counter(instance._saved_group_id, -1)
+        change_group_counter(instance.group_id, 1)
+    if created or instance.text != instance._saved_text:
+        sync_post_tags(instance)
+        sync_mentions(instance)
+    instance._saved_group_id = instance.group_id
+    instance._saved_text = instance.text
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    deleting_posts().add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    deleting_posts().discard(instance.pk)
+    bump_generations(post_scopes(instance))
+    change_user_counter(instance.author_id, posts_count=-1)
+    change_group_counter(instance.group_id, -1)
+    invalidate_timeline(instance.author_id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    bump_generations(post_scopes(instance.post))
+    if created:
+        change_comment_counter(instance.post_id, 1)
+        sync_mentions(instance.post, instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.post_id in deleting_posts():
+        return
+    # Для лент нужны только автор и группа поста: без уже загруженного
+    # поста они читаются одним коротким запросом.
+    if Comment.post.is_cached(instance):
+        post = instance.post
+    else:
+        post = Post.objects.only('author', 'group').filter(
+            pk=instance.post_id
+        ).first()
+    if post is not None:
+        bump_generations(post_scopes(post))
+    change_comment_counter(instance.post_id, -1)
+
+
+def follow_scopes(follow):
+    """Профили, в которых видна подписка: счётчики и кнопка подписки."""
+    return [f'author:{follow.user_id}', f'author:{follow.author_id}']
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, update_fields=None,
+               **kwargs):
+    """Имя автора выводится в карточках его постов и в лентах с ними.
+    Вход пользователя сохраняет только last_login и ленты не трогает."""
+    if created or raw or (
+        update_fields is not None and not USER_INFO_FIELDS & update_fields
+    ):
+        return
+    group_ids = Post.objects.filter(author_id=instance.id).exclude(
+        group_id=None
+    ).values_list('group_id', flat=True).distinct()
+    bump_generations([
+        f'author-info:{instance.id}', 'index', f'author:{instance.id}',
+        *(f'group:{group_id}' for group_id in group_ids),
+    ])
+
+
+def group_scopes(group, post_ids=()):
+    """Ленты, где видны название и ссылка группы: сама группа, главная
+    и профили авторов её постов."""
+    author_ids = Post.objects.filter(group_id=group.id).values_list(
+        'author_id', flat=True
+    ).distinct()
+    return [
+        f'group:{group.id}', f'group-info:{group.id}', 'index',
+        *(f'author:{author_id}' for author_id in author_ids),
+        *(f'post:{post_id}' for post_id in post_ids),
+    ]
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        bump_generations(group_scopes(instance))
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    """Посты группы при удалении остаются без группы через SET_NULL без
+    сигналов, поэтому ленты собираются до удаления: у самих постов
+    меняется поле group в API."""
+    instance._deleted_scopes = group_scopes(
+        instance,
+        Post.objects.filter(group_id=instance.id).values_list(
+            'id', flat=True
+        ),
+    )
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    bump_generations(getattr(instance, '_deleted_scopes', ()))
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump_generations(follow_scopes(instance))
+        change_user_counter(instance.user_id, following_count=1)
+        change_user_counter(instance.author_id, followers_count=1)
+        if push_feed_enabled():
+            backfill_feed(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    bump_generations(follow_scopes(instance))
+    change_user_counter(instance.user_id, following_count=-1)
+    change_user_counter(instance.author_id, followers_count=-1)
+    if push_feed_enabled():
+        prune_feed(instance)
@@ -0,0 +1,57 @@
+import re
+
+from django.contrib.auth import get_user_model
+
+from .models import Mention, PostTag, Tag
+
+User = get_user_model()
+
+TAG = re.compile(r'(?<![\w&#])#(\w{1,100})')
+# Имя начинается с буквы или цифры: иначе «@...» дало бы пустое имя.
+MENTION = re.compile(r'(?<![\w@])@(\w[\w.+-]{0,149})')
+
+
+def extract_tags(text):
+    """Возвращает имена хештегов текста в нижнем регистре без
+    повторов, в порядке появления."""
+    return list(dict.fromkeys(name.lower() for name in TAG.findall(text)))
+
+
+def extract_mentions(text):
+    """Возвращает упомянутые через @ имена пользователей без повторов."""
+    return list(dict.fromkeys(
+        name.rstrip('.') for name in MENTION.findall(text)
+    ))
+
+
+def sync_post_tags(post):
+    """Приводит хештеги поста в соответствие с его текстом."""
+    names = extract_tags(post.text)
+    if names:
+        Tag.objects.bulk_create(
+            [Tag(name=name) for name in names], ignore_conflicts=True
+        )
+    tag_ids = list(
+        Tag.objects.filter(name__in=names).values_list('id', flat=True)
+    )
+    post.post_tags.exclude(tag_id__in=tag_ids).delete()
+    PostTag.objects.bulk_create(
+        [PostTag(post=post, tag_id=tag_id, pub_date=post.pub_date)
+         for tag_id in tag_ids],
+        ignore_conflicts=True,
+    )
+
+
+def sync_mentions(post, comment=None):
+    """Пересоздаёт упоминания пользователей из текста поста или,
+    если передан comment, из текста комментария."""
+    source = comment or post
+    created = comment.created if comment else post.pub_date
+    Mention.objects.filter(post=post, comment=comment).delete()
+    users = User.objects.filter(
+        username__in=extract_mentions(source.text)
+    ).exclude(id=source.author_id).values_list('id', flat=True)
+    Mention.objects.bulk_create(
+        Mention(user_id=user_id, post=post, comment=comment, created=created)
+        for user_id in users
+    )
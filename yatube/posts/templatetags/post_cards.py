@@ -0,0 +1,54 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from posts.generations import get_generations
+from posts.thumbnails import resolve_thumbnails
+
+register = template.Library()
+
+CARD_KEY = 'posts:card:{}:{}:{}:{}:{}'
+
+
+def info_scopes(post):
+    """Поколения, которые меняются при правке автора и группы поста:
+    их имена и названия выводятся в карточке."""
+    scopes = [f'author-info:{post.author_id}']
+    if post.group_id is not None:
+        scopes.append(f'group-info:{post.group_id}')
+    return scopes
+
+
+def card_key(post, generations):
+    """Ключ карточки меняется при каждом сохранении поста, правке его
+    автора и группы и при переносе в другую группу."""
+    return CARD_KEY.format(
+        post.id,
+        int(post.updated.timestamp() * 10**6),
+        generations[f'author-info:{post.author_id}'],
+        post.group_id,
+        generations.get(f'group-info:{post.group_id}'),
+    )
+
+
+@register.simple_tag
+def post_cards(posts):
+    """Возвращает карточки постов страницы: готовые берутся из кеша
+    одним запросом, отрисовываются только отсутствующие."""
+    generations = get_generations(
+        {scope for post in posts for scope in info_scopes(post)}
+    )
+    keys = {card_key(post, generations): post for post in posts}
+    cards = cache.get_many(keys)
+    missing = {key: post for key, post in keys.items() if key not in cards}
+    resolve_thumbnails(missing.values(), 'card')
+    missing = {
+        key: render_to_string('includes/main.html', {'post': post})
+        for key, post in missing.items()
+    }
+    if missing:
+        cache.set_many(missing, settings.CARD_CACHE_TIMEOUT)
+        cards.update(missing)
+    return [mark_safe(cards[key]) for key in keys]
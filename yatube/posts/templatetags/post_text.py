@@ -0,0 +1,60 @@
+import re
+
+from django import template
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils.html import escape, format_html
+from django.utils.safestring import mark_safe
+
+from posts.tags import MENTION, TAG, extract_mentions
+
+User = get_user_model()
+register = template.Library()
+
+# Теги и упоминания ищутся в исходном тексте теми же выражениями, что и
+# при извлечении: в экранированном тексте иначе нашлись бы, например,
+# теги после «&», которых нет в базе. Первая группа — тег, вторая —
+# упоминание.
+LINK = re.compile(f'{TAG.pattern}|{MENTION.pattern}')
+
+
+def tag_link(name):
+    return format_html(
+        '<a href="{}">#{}</a>',
+        reverse('posts:tag_posts', args=(name.lower(),)),
+        name,
+    )
+
+
+def mention_link(name, known):
+    username = name.rstrip('.')
+    if username not in known:
+        return escape(f'@{name}')
+    return format_html(
+        '<a href="{}">@{}</a>{}',
+        reverse('posts:profile', args=(username,)),
+        username,
+        name[len(username):],
+    )
+
+
+@register.filter(is_safe=True)
+def linkify(text):
+    """Экранирует текст и превращает #теги и @упоминания в ссылки.
+    Ссылками становятся только упоминания существующих пользователей:
+    их имена читаются одним запросом, если в тексте есть упоминания."""
+    mentioned = extract_mentions(text)
+    known = set()
+    if mentioned:
+        known = set(User.objects.filter(username__in=mentioned).values_list(
+            'username', flat=True
+        ))
+    parts = []
+    position = 0
+    for match in LINK.finditer(text):
+        parts.append(escape(text[position:match.start()]))
+        tag, username = match.groups()
+        parts.append(tag_link(tag) if tag else mention_link(username, known))
+        position = match.end()
+    parts.append(escape(text[position:]))
+    return mark_safe(''.join(parts))
@@ -0,0 +1,314 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import F
+from PIL import Image
+
+from ..generations import get_generation
+from ..models import (Post, Comment, FeedEntry, Follow, Group, Mention,
+                      PostTag, UserCounter)
+from ..search import search
+from ..thumbnails import generate_thumbnails
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+def make_jpeg(width, height, **options):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), 'red').save(buffer, 'JPEG', **options)
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ManagementCommandTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user('author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_backfill_image_metadata(self):
+        """Команда заполняет размеры картинок старых постов."""
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                name='small_5.gif', content=SMALL_GIF,
+                content_type='image/gif'
+            ),
+        )
+        Post.objects.filter(id=post.id).update(
+            image_width=None, image_height=None, image_placeholder=''
+        )
+        generation = get_generation(f'post:{post.id}')
+        with self.assertNumQueries(2):
+            call_command('backfill_image_metadata', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertTrue(post.image_placeholder)
+        self.assertGreater(get_generation(f'post:{post.id}'), generation)
+
+    def test_shard_post_images_moves_legacy_paths(self):
+        """Команда переносит картинки со старыми путями под имена по
+        содержимому и удаляет старые файлы."""
+        storage = Post._meta.get_field('image').storage
+        legacy = FileSystemStorage().save(
+            'posts/legacy.gif', ContentFile(SMALL_GIF)
+        )
+        post = Post.objects.create(author=self.user, text='Старый пост')
+        Post.objects.filter(id=post.id).update(image=legacy)
+        call_command('shard_post_images', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertTrue(storage.is_content_name(post.image.name))
+        self.assertTrue(storage.exists(post.image.name))
+        self.assertFalse(storage.exists(legacy))
+        with post.image.open() as image:
+            self.assertEqual(image.read(), SMALL_GIF)
+
+    def test_collect_media_garbage_removes_orphans(self):
+        """Команда удаляет файлы без постов и их миниатюры, не трогая
+        нужные и свежие файлы."""
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                name='kept.gif', content=SMALL_GIF, content_type='image/gif'
+            ),
+        )
+        thumbnails = generate_thumbnails(post.image.name).values()
+        kept = [post.image.name, *(image.name for image in thumbnails)]
+        storage = FileSystemStorage()
+        orphans = [
+            storage.save('posts/orphan.gif', ContentFile(b'orphan')),
+            storage.save('cache/ab/cd/orphan.jpg', ContentFile(b'orphan')),
+        ]
+        fresh = storage.save('posts/fresh.gif', ContentFile(b'fresh'))
+        old = time.time() - 2 * 24 * 60 * 60
+        for name in kept + orphans:
+            os.utime(storage.path(name), (old, old))
+
+        out = StringIO()
+        call_command('collect_media_garbage', '--dry-run', stdout=out)
+        for name in orphans:
+            self.assertIn(name, out.getvalue())
+            self.assertTrue(storage.exists(name))
+
+        quarantine = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, quarantine, ignore_errors=True)
+        call_command(
+            'collect_media_garbage', '--chunk-size', '2', '--max-rate', '0',
+            '--quarantine', quarantine, stdout=StringIO()
+        )
+        for name in orphans:
+            self.assertFalse(storage.exists(name))
+            self.assertTrue(os.path.exists(os.path.join(quarantine, name)))
+        for name in kept + [fresh]:
+            self.assertTrue(storage.exists(name))
+
+    def test_import_content_bulk_loads_and_resumes(self):
+        """Импорт связывает записи по id выгрузки, сохраняет даты,
+        копирует картинки и при повторном запуске ничего не дублирует."""
+        source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source, ignore_errors=True)
+        with open(os.path.join(source, 'photo.jpg'), 'wb') as image:
+            image.write(make_jpeg(40, 20))
+
+        def write(name, lines):
+            path = os.path.join(source, name)
+            with open(path, 'w', encoding='utf-8') as output:
+                output.write('\n'.join(lines) + '\n')
+            return path
+
+        def jsonl(name, rows):
+            return write(name, [json.dumps(row) for row in rows])
+
+        files = {
+            'users': jsonl('users.jsonl', [
+                {'id': 7, 'username': 'author'},
+                {'id': 8, 'username': 'imported'},
+            ]),
+            'groups': jsonl('groups.jsonl', [
+                {'id': 3, 'title': 'Старая группа', 'slug': 'old'},
+            ]),
+            'posts': jsonl('posts.jsonl', [
+                {'id': 100, 'author': 8, 'group': 3, 'text': 'Старый пост',
+                 'pub_date': '2015-05-01T10:00:00Z', 'image': 'photo.jpg'},
+                {'id': 101, 'author': 7, 'group': None, 'text': 'Второй',
+                 'pub_date': '2016-01-01T00:00:00Z'},
+                {'id': 102, 'author': 99, 'text': 'Без автора'},
+                {'id': 103, 'author': 7},
+            ]),
+            'comments': write('comments.csv', [
+                'id,post,author,text,created',
+                '1,100,7,Комментарий,2015-05-02 10:00:00',
+                '2,100,,Без автора,2015-05-02 11:00:00',
+            ]),
+            'follows': write('follows.csv', ['user,author', '7,8', '8,8']),
+        }
+        arguments = [f'--{kind}={path}' for kind, path in files.items()]
+        arguments += [f'--media-source={source}', '--transaction-size=2']
+        out = StringIO()
+        err = StringIO()
+        call_command('import_content', *arguments, stdout=out, stderr=err)
+        self.assertIn('строк/с', out.getvalue())
+        for message in (
+            'posts: строка id 102 пропущена: author 99 не импортирован',
+            'posts: строка id 103 пропущена: не заполнено поле text',
+            'comments: строка id 2 пропущена: не заполнено поле author',
+            'follows: строка {"user": "8", "author": "8"} пропущена: '
+            'подписка на самого себя',
+        ):
+            self.assertIn(message, err.getvalue())
+        self.assertFalse(Follow.objects.filter(user=F('author')).exists())
+
+        imported = User.objects.get(username='imported')
+        post = Post.objects.get(text='Старый пост')
+        self.assertEqual(post.author, imported)
+        self.assertEqual(post.group, Group.objects.get(slug='old'))
+        self.assertEqual(post.pub_date.year, 2015)
+        self.assertEqual((post.image_width, post.image_height), (40, 20))
+        storage = Post._meta.get_field('image').storage
+        self.assertTrue(storage.is_content_name(post.image.name))
+        self.assertTrue(storage.exists(post.image.name))
+        comment = Comment.objects.get()
+        self.assertEqual((comment.post, comment.author), (post, self.user))
+        self.assertEqual(comment.created.day, 2)
+        self.assertTrue(
+            Follow.objects.filter(user=self.user, author=imported).exists()
+        )
+        self.assertFalse(Post.objects.filter(text='Без автора').exists())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(UserCounter.objects.get(user=imported).posts_count, 1)
+
+        counts = [model.objects.count()
+                  for model in (User, Group, Post, Comment, Follow)]
+        call_command(
+            'import_content', *arguments, stdout=StringIO(), stderr=StringIO()
+        )
+        self.assertEqual(counts, [
+            model.objects.count()
+            for model in (User, Group, Post, Comment, Follow)
+        ])
+        new = Post.objects.create(author=self.user, text='После импорта')
+        self.assertGreater(new.pk, post.pk)
+
+    def test_generate_dataset_is_deterministic(self):
+        """Генератор с одним seed создаёт те же данные, подписчики
+        распределены неравномерно, счётчики пересчитаны."""
+        arguments = ['--users=50', '--groups=3', '--posts=200',
+                     '--comments=100', '--follows=300', '--images=2',
+                     '--image-ratio=0.5', '--seed=7', '--batch-size=64']
+
+        def generate():
+            call_command('generate_dataset', *arguments, stdout=StringIO())
+            posts = Post.objects.filter(author__username__startswith='synth')
+            return (
+                list(posts.order_by('pk').values_list(
+                    'author__username', 'text', 'pub_date', 'image_width'
+                )),
+                list(Follow.objects.filter(
+                    user__username__startswith='synth'
+                ).order_by('pk').values_list(
+                    'user__username', 'author__username'
+                )),
+            )
+
+        posts, follows = generate()
+        self.assertEqual(len(posts), 200)
+        self.assertEqual(
+            Comment.objects.filter(author__username__startswith='synth')
+            .count(), 100
+        )
+        self.assertTrue(any(width for *_, width in posts))
+        self.assertTrue(any(width is None for *_, width in posts))
+        followers = sorted(
+            UserCounter.objects.filter(
+                user__username__startswith='synth'
+            ).values_list('followers_count', flat=True),
+            reverse=True,
+        )
+        # Первое место по подписчикам заметно опережает медиану.
+        self.assertGreater(followers[0], 5 * max(followers[25], 1))
+        self.assertEqual(sum(followers), len(follows))
+        post = Post.objects.filter(comments_count__gt=0).first()
+        self.assertEqual(post.comments_count, post.comments.count())
+        word = post.text.split()[0].strip('.,')
+        self.assertIn(post, search(Post.objects.all(), 'posts_post_fts', word))
+        with self.assertRaisesMessage(CommandError, "префиксом 'synthetic'"):
+            call_command('generate_dataset', *arguments, stdout=StringIO())
+
+        User.objects.filter(username__startswith='synth').delete()
+        Group.objects.filter(slug__startswith='synth').delete()
+        self.assertEqual(generate(), (posts, follows))
+
+    def test_generate_dataset_without_rebuild_recounts_counters(self):
+        """--no-rebuild пропускает только ленты подписок: счётчики
+        пересчитаны, и удаление сразу после генерации проходит."""
+        call_command(
+            'generate_dataset', '--users=10', '--groups=2', '--posts=20',
+            '--comments=20', '--follows=20', '--images=0', '--no-rebuild',
+            stdout=StringIO(),
+        )
+        post = Post.objects.filter(comments_count__gt=0).first()
+        self.assertEqual(post.comments_count, post.comments.count())
+        self.assertTrue(UserCounter.objects.filter(posts_count__gt=0).exists())
+        self.assertFalse(FeedEntry.objects.exists())
+        post.comments.first().delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, post.comments.count())
+
+    def test_recount_counters_repairs_drift(self):
+        """Команда recount_counters исправляет разошедшиеся счётчики"""
+        group = Group.objects.create(slug='drift')
+        Post.objects.create(author=self.user, group=group, text='Пост')
+        UserCounter.objects.filter(user=self.user).update(posts_count=42)
+        Group.objects.update(posts_count=42)
+        call_command('recount_counters', stdout=StringIO())
+        self.assertEqual(
+            UserCounter.objects.get(user=self.user).posts_count,
+            self.user.posts.count()
+        )
+        group.refresh_from_db()
+        self.assertEqual(group.posts_count, group.group.count())
+
+    def test_rebuild_tags_restores_index(self):
+        """Команда восстанавливает хештеги после записи в обход модели"""
+        post = Post.objects.create(author=self.user, text='Пост')
+        Post.objects.filter(pk=post.pk).update(text='Пост с #тегом')
+        self.assertFalse(PostTag.objects.exists())
+        call_command('rebuild_tags', stdout=StringIO())
+        self.assertEqual(
+            list(PostTag.objects.values_list('post', 'tag__name')),
+            [(post.pk, 'тегом')],
+        )
+        self.assertFalse(Mention.objects.exists())
@@ -1,11 +1,17 @@
+import os
 import shutil
 import tempfile
+import struct
+from io import BytesIO
+from unittest.mock import patch
 
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
 
 from ..models import Post, Comment
+from ..thumbnails import generate_thumbnails, resolve_thumbnails
 from django.conf import settings
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
@@ -23,6 +29,36 @@ SMALL_GIF = (
 )
 
 
+def make_jpeg(width, height, **options):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), 'red').save(buffer, 'JPEG', **options)
+    return buffer.getvalue()
+
+
+def make_mpo(width, height):
+    """Снимок в формате MPO, как с телефона: основной JPEG с разметкой
+    MP Format в APP2 и превью следом."""
+    primary, preview = make_jpeg(width, height), make_jpeg(16, 8)
+    # Заголовок TIFF начинается через 10 байт: SOI, маркер и длина APP2,
+    # сигнатура MPF; смещения кадров считаются от него.
+    header_size = 82
+    primary_size = len(primary) + 2 + 2 + 4 + header_size
+    entries = struct.pack(
+        '>LLLHHLLLHH',
+        0x20030000, primary_size, 0, 0, 0,
+        0x00010001, len(preview), primary_size - 10, 0, 0,
+    )
+    mp = (
+        b'MM\x00\x2a' + struct.pack('>LH', 8, 3)
+        + struct.pack('>HHL4s', 0xB000, 7, 4, b'0100')
+        + struct.pack('>HHLL', 0xB001, 4, 1, 2)
+        + struct.pack('>HHLL', 0xB002, 7, len(entries), 50)
+        + struct.pack('>L', 0) + entries
+    )
+    segment = b'\xff\xe2' + struct.pack('>H', len(mp) + 6) + b'MPF\x00' + mp
+    return primary[:2] + segment + primary[2:] + preview
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostCreateFormTests(TestCase):
     @classmethod
@@ -34,15 +70,13 @@ class PostCreateFormTests(TestCase):
             text='Текст поста',
         )
 
-    def setUp(self):
-        cache.clear()
-
     @classmethod
     def tearDownClass(cls):
         super().tearDownClass()
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -73,7 +107,7 @@ class PostCreateFormTests(TestCase):
             Post.objects.filter(
                 author=self.user,
                 text='Тут написан текст поста',
-                image='posts/small.gif').exists()
+                image__endswith='.gif').exists()
         )
 
     def test_edit_post(self):
@@ -98,8 +132,58 @@ class PostCreateFormTests(TestCase):
                 id=self.post.id,
                 author=self.user,
                 text='Тут написан текст поста',
-                image='posts/small_2.gif').exists()
+                image__endswith='.gif').exists()
+        )
+
+    def test_image_metadata_is_stored_on_upload(self):
+        """Размеры и заглушка картинки сохраняются вместе с постом и
+        сбрасываются, когда картинку убирают."""
+        uploaded = SimpleUploadedFile(
+            name='small_4.gif',
+            content=SMALL_GIF,
+            content_type='image/gif'
+        )
+        self.authorized_client.post(
+            reverse('posts:post_edit', args=(self.post.id,)),
+            data={'text': self.post.text, 'image': uploaded},
         )
+        post = Post.objects.get(id=self.post.id)
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/jpeg;base64,')
+        )
+        self.authorized_client.post(
+            reverse('posts:post_edit', args=(self.post.id,)),
+            data={'text': self.post.text, 'image-clear': 'on'},
+        )
+        post = Post.objects.get(id=self.post.id)
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_placeholder, '')
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_create_post_pregenerates_thumbnails(self):
+        """Миниатюры картинки создаются при сохранении поста, а не при
+        первом показе."""
+        uploaded = SimpleUploadedFile(
+            name='small_3.gif',
+            content=SMALL_GIF,
+            content_type='image/gif'
+        )
+        with patch('posts.thumbnails.transaction.on_commit',
+                   side_effect=lambda callback: callback()):
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Пост с картинкой', 'image': uploaded},
+            )
+        thumbnails = os.listdir(os.path.join(TEMP_MEDIA_ROOT, 'cache'))
+        self.assertTrue(thumbnails)
+        post = Post.objects.get(text='Пост с картинкой')
+        with patch('sorl.thumbnail.base.ThumbnailBackend._create_thumbnail'
+                   ) as create_thumbnail:
+            generate_thumbnails(post.image.name)
+            resolve_thumbnails([post], 'card')
+            resolve_thumbnails([post], 'detail')
+        create_thumbnail.assert_not_called()
 
     def test_auth_comment_create(self):
         """Авторизованный пользователь может оставить комментарии."""
@@ -129,3 +213,151 @@ class PostCreateFormTests(TestCase):
             follow=True,
         )
         self.assertEqual(set(Comment.objects.all()), comments)
+
+    @override_settings(POST_IMAGE_MAX_SIDE=100)
+    def test_large_image_is_downscaled_without_metadata(self):
+        """Большая картинка уменьшается, поворачивается по EXIF и
+        сохраняется без метаданных."""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Camera'
+        uploaded = SimpleUploadedFile(
+            name='photo.jpg',
+            content=make_jpeg(400, 200, exif=exif.tobytes()),
+            content_type='image/jpeg'
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с фотографией', 'image': uploaded},
+        )
+        post = Post.objects.get(text='Пост с фотографией')
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (50, 100))
+            self.assertFalse(image.getexif())
+        self.assertEqual((post.image_width, post.image_height), (50, 100))
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=100)
+    def test_image_is_rejected_by_header(self):
+        """Картинка с недопустимым числом пикселей отклоняется."""
+        uploaded = SimpleUploadedFile(
+            name='photo.jpg',
+            content=make_jpeg(20, 10),
+            content_type='image/jpeg'
+        )
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Слишком большая картинка', 'image': uploaded},
+        )
+        self.assertFormError(
+            response, 'form', 'image',
+            'Картинка слишком большая: 20×10 пикселей.'
+        )
+        self.assertFalse(
+            Post.objects.filter(text='Слишком большая картинка').exists()
+        )
+
+    @override_settings(POST_IMAGE_MAX_DECODED_PIXELS=100)
+    def test_decoded_pixel_limit_applies_only_without_draft(self):
+        """PNG декодируется целиком и ограничен строже, а JPEG того же
+        размера читается уменьшенным и принимается."""
+        buffer = BytesIO()
+        Image.new('RGB', (20, 10), 'red').save(buffer, 'PNG')
+        for name, content, error in (
+            ('large.png', buffer.getvalue(),
+             'Картинка слишком большая: 20×10 пикселей.'),
+            ('large.jpg', make_jpeg(20, 10), None),
+        ):
+            response = self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': name, 'image': SimpleUploadedFile(
+                    name=name, content=content, content_type='image/*'
+                )},
+            )
+            if error:
+                self.assertFormError(response, 'form', 'image', error)
+            self.assertEqual(
+                Post.objects.filter(text=name).exists(), error is None
+            )
+
+    def test_truncated_image_is_rejected(self):
+        """Картинка с целым заголовком, но обрезанными данными
+        отклоняется ошибкой формы."""
+        content = make_jpeg(400, 200)
+        uploaded = SimpleUploadedFile(
+            name='broken.jpg',
+            content=content[:len(content) // 2],
+            content_type='image/jpeg'
+        )
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Битая картинка', 'image': uploaded},
+        )
+        self.assertFormError(
+            response, 'form', 'image',
+            'Не удалось прочитать картинку: файл повреждён.'
+        )
+
+    @override_settings(POST_IMAGE_MAX_SIDE=100)
+    def test_mpo_photo_is_stored_as_jpeg(self):
+        """Снимок MPO с телефона принимается и сохраняется как JPEG
+        с одним кадром."""
+        content = make_mpo(400, 200)
+        with Image.open(BytesIO(content)) as image:
+            self.assertEqual(image.format, 'MPO')
+        uploaded = SimpleUploadedFile(
+            name='phone.jpg', content=content, content_type='image/jpeg'
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Снимок с телефона', 'image': uploaded},
+        )
+        post = Post.objects.get(text='Снимок с телефона')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (100, 50))
+
+    @override_settings(POST_IMAGE_MAX_SIDE=100)
+    def test_large_animation_is_rejected(self):
+        """Анимация больше допустимого размера отклоняется, а не
+        превращается в первый кадр."""
+        buffer = BytesIO()
+        frames = [Image.new('P', (200, 20), color) for color in (0, 1)]
+        frames[0].save(
+            buffer, 'GIF', save_all=True, append_images=frames[1:]
+        )
+        uploaded = SimpleUploadedFile(
+            name='animation.gif', content=buffer.getvalue(),
+            content_type='image/gif'
+        )
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Большая анимация', 'image': uploaded},
+        )
+        self.assertFormError(
+            response, 'form', 'image',
+            'Анимированная картинка больше 100 пикселей по стороне.'
+        )
+        self.assertFalse(Post.objects.filter(text='Большая анимация').exists())
+
+    def test_identical_images_are_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом с именем по
+        содержимому."""
+        names = set()
+        for name in ('same_1.gif', 'same_2.gif'):
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={
+                    'text': f'Пост с картинкой {name}',
+                    'image': SimpleUploadedFile(
+                        name=name, content=SMALL_GIF,
+                        content_type='image/gif'
+                    ),
+                },
+            )
+            post = Post.objects.get(text=f'Пост с картинкой {name}')
+            names.add(post.image.name)
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(post.image.storage.is_content_name(name))
+        self.assertTrue(os.path.exists(post.image.path))
@@ -1,17 +1,48 @@
+import base64
+import csv
+import json
 import shutil
 import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
 
 from django.conf import settings
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django import forms
+from sorl.thumbnail import default
 
-from ..models import Post, Group, Follow
+from ..search import ensure_search_indexes
+from ..serializers import PostSerializer, post_values, represent_posts
+from ..thumbnails import (resolve_thumbnails, thumbnail_size,
+                          thumbnail_variants)
+from ..tags import extract_mentions
+from ..views import COMMENTS_PER_PAGE
+from ..generations import GENERATION_KEY, MODIFIED_KEY, get_generation
+from ..jobs import run_job
+from ..paginators import EstimatedCountPaginator
+from ..models import (AdminJob, Post, Group, Follow, FeedEntry, UserCounter,
+                      Comment)
 
 User = get_user_model()
+MALFORMED_CURSORS = (
+    [None, None],
+    [1, 2],
+    [{}, 1],
+    [[1], [2]],
+    ['2021-01-01T00:00:00', 1],
+    ['2021-01-01T00:00:00+00:00', 10 ** 30],
+    ['2021-01-01T00:00:00+00:00'],
+)
 POST_AMOUNT_1 = 1
 POST_AMOUNT_10 = 10
 POST_AMOUNT_3 = 3
@@ -27,9 +58,13 @@ SMALL_GIF = (
 )
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
-class PostURLTests(TestCase):
+def make_cursor(values):
+    raw = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
 
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostsTestCase(TestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -55,6 +90,8 @@ class PostURLTests(TestCase):
         self.authorized_client.force_login(self.user)
         cache.clear()
 
+
+class PostURLTests(PostsTestCase):
     def test_urls_uses_correct_template(self):
         def url(url, **kwargs):
             return reverse(url, kwargs=kwargs)
@@ -202,20 +239,93 @@ class PostURLTests(TestCase):
                 response = self.guest_client.get(url)
                 self.assertEqual(len(response.context['page_obj']),
                                  POST_AMOUNT_10)
-                response = self.guest_client.get(url + '?page=2')
+                first_page = response.context['page_obj']
+                cursor = first_page.paginator.next_cursor
+                response = self.guest_client.get(url, {'after': cursor})
                 self.assertEqual(len(response.context['page_obj']),
                                  POST_AMOUNT_3)
+                self.assertFalse(response.context['page_obj'].has_next())
+                self.assertTrue(set(first_page).isdisjoint(
+                    response.context['page_obj']
+                ))
+                cursor = response.context['page_obj'].paginator.previous_cursor
+                response = self.guest_client.get(url, {'before': cursor})
+                self.assertEqual(list(response.context['page_obj']),
+                                 list(first_page))
+
+    def test_pages_do_not_count_posts(self):
+        """Ленты, профиль и страница поста не выполняют COUNT и OFFSET"""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        ]
+        for url in urls:
+            with CaptureQueriesContext(connection) as queries:
+                self.guest_client.get(url)
+            for query in queries.captured_queries:
+                with self.subTest(url=url, sql=query['sql']):
+                    self.assertNotIn('COUNT(', query['sql'].upper())
+                    self.assertNotIn('OFFSET', query['sql'].upper())
+
+    def test_paginator_ignores_broken_cursor(self):
+        """Повреждённый курсор открывает первую страницу ленты"""
+        response = self.guest_client.get(
+            reverse('posts:index'), {'after': 'не-курсор'}
+        )
+        self.assertEqual(response.context['page_obj'][0], self.post)
+
+    def test_paginator_ignores_crafted_cursors(self):
+        """Курсоры с None, вложенными значениями, числами вместо дат
+        и датами без часового пояса открывают первую страницу"""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        for values in MALFORMED_CURSORS:
+            for direction in ('after', 'before'):
+                with self.subTest(values=values, direction=direction):
+                    response = self.guest_client.get(
+                        url, {direction: make_cursor(values)}
+                    )
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(
+                        response.context['page_obj'][0], self.post
+                    )
 
     def test_post_index_page_contains_cache(self):
         """Для главной страницы работает функция кеширования"""
         cache_response = self.guest_client.get(reverse('posts:index'))
-        Post.objects.all().delete()
+        Post.objects.update(text='Текст, изменённый в обход модели')
         response = self.guest_client.get(reverse('posts:index'))
         self.assertEqual(cache_response.content, response.content)
         cache.clear()
         response = self.guest_client.get(reverse("posts:index"))
         self.assertNotEqual(cache_response.content, response.content)
 
+    def test_feed_cache_is_invalidated_by_writes(self):
+        """Запись поста сбрасывает кеш только затронутых лент"""
+        other_group = Group.objects.create(slug='other_group')
+        urls = {
+            'index': reverse('posts:index'),
+            'group': reverse('posts:group_list',
+                             kwargs={'slug': self.group.slug}),
+            'other_group': reverse('posts:group_list',
+                                   kwargs={'slug': other_group.slug}),
+            'profile': reverse('posts:profile',
+                               kwargs={'username': self.user}),
+        }
+        cached = {name: self.guest_client.get(url).content
+                  for name, url in urls.items()}
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Отредактированный текст поста'
+        post.save()
+        for name, url in urls.items():
+            with self.subTest(page=name):
+                content = self.guest_client.get(url).content
+                if name == 'other_group':
+                    self.assertEqual(content, cached[name])
+                else:
+                    self.assertNotEqual(content, cached[name])
+                    self.assertIn(post.text.encode(), content)
+
     def test_auth_user_can_follow_the_author(self):
         """Авторизованный пользователь может подписываться на авторов"""
         count_follower = Follow.objects.count()
@@ -262,3 +372,853 @@ class PostURLTests(TestCase):
         response = self.authorized_client.get(reverse('posts:follow_index'))
         self.assertEqual(len(response.context['page_obj']), 0)
         self.assertNotContains(response, post_for_test.text)
+
+    @override_settings(FOLLOW_FEED_BATCH_SIZE=1)
+    def test_new_post_fans_out_to_all_followers(self):
+        """Новый пост раскладывается по лентам всех подписчиков пачками"""
+        followers = [
+            User.objects.create_user(f'follower_{i}') for i in range(3)
+        ]
+        for follower in followers:
+            Follow.objects.create(user=follower, author=self.following)
+        post_for_test = Post.objects.create(
+            author=self.following,
+            text='Пост для ленты подписчиков'
+        )
+        self.assertEqual(
+            FeedEntry.objects.filter(post=post_for_test).count(),
+            len(followers)
+        )
+
+    def test_unfollow_prunes_the_feed(self):
+        """После отписки посты автора пропадают из ленты подписок"""
+        Post.objects.create(author=self.following, text='Пост для ленты')
+        self.authorized_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.following})
+        )
+        self.assertEqual(self.user.feed_entries.count(), 1)
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.following})
+        )
+        self.assertFalse(self.user.feed_entries.exists())
+
+    def test_follow_feed_paginates_by_cursor(self):
+        """Лента подписок листается курсорами по записям ленты"""
+        Follow.objects.create(user=self.user, author=self.following)
+        Post.objects.bulk_create(
+            Post(author=self.following, text=f'Пост номер {i}')
+            for i in range(LAST_POST_COUNT_13)
+        )
+        for post in Post.objects.filter(author=self.following):
+            FeedEntry.objects.create(
+                user=self.user, author=self.following,
+                post=post, pub_date=post.pub_date
+            )
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), POST_AMOUNT_10)
+        response = self.authorized_client.get(
+            reverse('posts:follow_index'),
+            {'after': page_obj.paginator.next_cursor}
+        )
+        self.assertEqual(len(response.context['page_obj']), POST_AMOUNT_3)
+        self.assertIsInstance(response.context['page_obj'][0], Post)
+
+    @override_settings(FOLLOW_FEED_ENGINE='pull')
+    def test_pull_feed_merges_author_timelines(self):
+        """Лента подписок в режиме 'pull' собирается из лент авторов
+        в порядке публикации и без записей в FeedEntry"""
+        second_author = User.objects.create_user('SecondAuthor')
+        Follow.objects.create(user=self.user, author=self.following)
+        Follow.objects.create(user=self.user, author=second_author)
+        for i in range(LAST_POST_COUNT_13):
+            Post.objects.create(
+                author=(self.following, second_author)[i % 2],
+                text=f'Пост номер {i}'
+            )
+        self.assertFalse(FeedEntry.objects.exists())
+        expected = list(Post.objects.filter(
+            author__in=(self.following, second_author)
+        ).order_by('-pub_date', '-id'))
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        page_obj = response.context['page_obj']
+        self.assertEqual(list(page_obj), expected[:POST_AMOUNT_10])
+        response = self.authorized_client.get(
+            reverse('posts:follow_index'),
+            {'after': page_obj.paginator.next_cursor}
+        )
+        self.assertEqual(list(response.context['page_obj']),
+                         expected[POST_AMOUNT_10:])
+        cursor = response.context['page_obj'].paginator.previous_cursor
+        response = self.authorized_client.get(
+            reverse('posts:follow_index'), {'before': cursor}
+        )
+        self.assertEqual(list(response.context['page_obj']),
+                         expected[:POST_AMOUNT_10])
+
+    def test_counters_follow_writes(self):
+        """Счётчики постов, подписок и комментариев меняются вместе
+        с записями"""
+        self.authorized_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.following})
+        )
+        post_for_test = Post.objects.create(
+            author=self.following, text='Пост', group=self.group
+        )
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post_for_test.id}),
+            {'text': 'Комментарий'}
+        )
+        response = self.guest_client.get(
+            reverse('posts:profile', kwargs={'username': self.following})
+        )
+        self.assertEqual(response.context['count'], 1)
+        self.assertEqual(response.context['follower_counts'], 1)
+        self.assertEqual(self.user.counters.following_count, 1)
+        post_for_test.refresh_from_db()
+        self.assertEqual(post_for_test.comments_count, 1)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 2)
+
+        post_for_test.group = None
+        post_for_test.save()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        post_for_test.delete()
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.following})
+        )
+        counter = UserCounter.objects.get(user=self.following)
+        self.assertEqual(counter.posts_count, 0)
+        self.assertEqual(counter.followers_count, 0)
+
+    def test_counters_below_true_value_do_not_block_deletes(self):
+        """Удаление при счётчиках, отставших от данных, проходит, а
+        счётчики не уходят ниже нуля"""
+        post = Post.objects.create(
+            author=self.user, group=self.group, text='Пост на удаление'
+        )
+        comment = Comment.objects.create(
+            post=post, author=self.user, text='Комментарий'
+        )
+        Follow.objects.create(user=self.user, author=self.following)
+        Post.objects.filter(pk=post.pk).update(comments_count=0)
+        Group.objects.update(posts_count=0)
+        UserCounter.objects.update(
+            posts_count=0, followers_count=0, following_count=0
+        )
+        comment.delete()
+        Follow.objects.all().delete()
+        post.delete()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(
+            UserCounter.objects.get(user=self.user).posts_count, 0
+        )
+
+    def test_post_delete_queries_do_not_grow_with_comments(self):
+        """Каскадное удаление комментариев не читает пост и не трогает
+        его счётчик для каждого комментария"""
+        def delete_post(comments):
+            post = Post.objects.create(author=self.user, text='Пост')
+            for i in range(comments):
+                Comment.objects.create(
+                    post=post, author=self.user, text=f'Комментарий {i}'
+                )
+            with CaptureQueriesContext(connection) as queries:
+                post.delete()
+            self.assertFalse(Comment.objects.filter(post_id=post.id).exists())
+            return len(queries.captured_queries)
+
+        self.assertEqual(delete_post(30), delete_post(1))
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text='Одиночный'
+        )
+        comments_count = Post.objects.get(pk=self.post.pk).comments_count
+        Comment.objects.get(pk=comment.pk).delete()
+        self.assertEqual(
+            Post.objects.get(pk=self.post.pk).comments_count,
+            comments_count - 1,
+        )
+
+    def test_post_detail_queries_do_not_grow_with_comments(self):
+        """Число запросов страницы поста не зависит от числа
+        комментариев, лишние комментарии подгружаются фрагментом"""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        Comment.objects.create(post=self.post, author=self.user, text='0')
+        self.guest_client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(url)
+        authors = [
+            User.objects.create_user(f'commentator_{i}') for i in range(30)
+        ]
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=author, text=f'{i + 1}')
+            for i, author in enumerate(authors)
+        )
+        with self.assertNumQueries(len(queries.captured_queries)):
+            response = self.guest_client.get(url)
+        comments = response.context['comments']
+        self.assertEqual(
+            [comment.text for comment in comments],
+            [str(i) for i in range(COMMENTS_PER_PAGE)]
+        )
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.id}),
+            {'after': comments.paginator.next_cursor}
+        )
+        self.assertTemplateUsed(response, 'includes/comments.html')
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            [str(i) for i in range(COMMENTS_PER_PAGE, len(authors) + 1)]
+        )
+
+    def test_post_cards_are_shared_between_feeds(self):
+        """Карточка поста отрисовывается один раз для всех лент и
+        перерисовывается после сохранения поста"""
+        post = Post.objects.get(pk=self.post.pk)
+        self.guest_client.get(reverse('posts:index'))
+        Post.objects.update(text='Текст, изменённый в обход модели')
+        response = self.guest_client.get(
+            reverse('posts:profile', kwargs={'username': self.user})
+        )
+        self.assertContains(response, post.text)
+        post.text = 'Отредактированный текст поста'
+        post.save()
+        response = self.guest_client.get(
+            reverse('posts:profile', kwargs={'username': self.user})
+        )
+        self.assertContains(response, post.text)
+
+    def test_deferred_group_is_not_loaded_per_post(self):
+        """Посты, загруженные без группы, не читают её по одному, а при
+        сохранении счётчики групп остаются верными"""
+        for number in range(3):
+            Post.objects.create(
+                author=self.user, group=self.group, text=f'Пост {number}'
+            )
+        with self.assertNumQueries(1):
+            posts = list(Post.objects.only('id', 'text'))
+        post = posts[0]
+        post.text = 'Новый текст'
+        post.save()
+        group = Group.objects.get(pk=self.group.pk)
+        self.assertEqual(group.posts_count, group.group.count())
+
+    def test_post_cards_follow_author_and_group_changes(self):
+        """Карточки перерисовываются после правки имени автора и группы
+        поста, но не после входа автора на сайт"""
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        author = User.objects.get(pk=self.user.pk)
+        generation = get_generation(f'author-info:{author.pk}')
+        self.client.force_login(author)
+        self.assertEqual(
+            get_generation(f'author-info:{author.pk}'), generation
+        )
+        author.first_name = 'Переименованный'
+        author.save()
+        self.assertContains(self.guest_client.get(url), 'Переименованный')
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'renamed_slug'
+        group.save()
+        response = self.guest_client.get(
+            reverse('posts:group_list', kwargs={'slug': group.slug})
+        )
+        self.assertContains(
+            response, f'href="/group/{group.slug}/"'
+        )
+
+    def test_feed_resolves_thumbnails_in_one_lookup(self):
+        """Миниатюры страницы ищутся одним запросом к kvstore, а
+        недостающие создаются до отрисовки карточек"""
+        posts = [
+            Post.objects.create(
+                author=self.user,
+                text=f'Пост с картинкой {i}',
+                image=SimpleUploadedFile(
+                    name=f'feed_{i}.gif', content=SMALL_GIF,
+                    content_type='image/gif'
+                )
+            )
+            for i in range(POST_AMOUNT_3)
+        ]
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'card-img', count=len(posts) + 1)
+        resolved = resolve_thumbnails(
+            list(Post.objects.filter(text__startswith='Пост с картинкой')),
+            'card'
+        )
+        for post in resolved:
+            self.assertContains(response, post.thumbnail.url)
+        cache.delete_many([key for key in cache.iter_keys()
+                           if not key.startswith('sorl-thumbnail')])
+        with patch('posts.thumbnails.get_thumbnail') as get_thumbnail, \
+                patch.object(default.kvstore, 'get_many',
+                             wraps=default.kvstore.get_many) as get_many:
+            response = self.guest_client.get(reverse('posts:index'))
+        get_thumbnail.assert_not_called()
+        get_many.assert_called_once()
+        for post in resolved:
+            self.assertContains(response, post.thumbnail.url)
+
+    def test_post_detail_shows_detail_thumbnail(self):
+        """Страница поста выводит миниатюру detail"""
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        )
+        post = response.context['post']
+        self.assertTrue(post.thumbnail.exists())
+        self.assertContains(response, post.thumbnail.url)
+        self.assertContains(response, post.image_placeholder)
+        self.assertEqual(list(post.thumbnail_size), post.thumbnail.size)
+        self.assertContains(response, 'width="678" height="339"')
+
+    def test_image_dimensions_come_from_stored_columns(self):
+        """Размеры миниатюры в разметке считаются по сохранённым
+        размерам картинки, а не по kvstore"""
+        post = Post.objects.get(pk=self.post.pk)
+        post.image_width, post.image_height = 4000, 3000
+        resolve_thumbnails([post], 'detail')
+        self.assertEqual(post.thumbnail_size, (452, 339))
+        resolve_thumbnails([post], 'card')
+        self.assertEqual(post.thumbnail_size, (960, 339))
+        post.image_width = post.image_height = None
+        self.assertIsNone(thumbnail_size(post, 'card'))
+
+    @override_settings(POST_THUMBNAIL_FORMATS=('WEBP', 'AVIF', 'JPEG'))
+    def test_thumbnails_have_responsive_variants(self):
+        """Миниатюра создаётся в нескольких ширинах для srcset, форматы
+        без поддержки в Pillow пропускаются"""
+        formats = [variant[0] for variant in thumbnail_variants('card')]
+        self.assertNotIn('AVIF', formats)
+        self.assertEqual(formats[-1], 'JPEG')
+        response = self.guest_client.get(reverse('posts:index'))
+        post = Post.objects.get(pk=self.post.pk)
+        resolve_thumbnails([post], 'card')
+        srcset = post.thumbnail_srcsets['jpeg']
+        for width in settings.POST_THUMBNAIL_WIDTHS:
+            self.assertIn(f' {width}w', srcset)
+        self.assertContains(response, f'srcset="{srcset}"')
+        self.assertEqual(set(post.thumbnail_srcsets),
+                         {image_format.lower() for image_format in formats})
+        self.assertEqual(post.thumbnail.width, 960)
+
+    def test_search_ranks_and_highlights_posts(self):
+        """Поиск находит посты по началу слова, выделяет совпадения и
+        экранирует текст"""
+        Post.objects.create(
+            author=self.user, text='<b>Котики</b> и собаки, котики везде'
+        )
+        Post.objects.create(author=self.user, text='Про котика')
+        Post.objects.create(author=self.user, text='Про собак')
+        response = self.guest_client.get(
+            reverse('posts:post_search'), {'q': 'котик'}
+        )
+        posts = list(response.context['page_obj'])
+        self.assertEqual(len(posts), 2)
+        self.assertLessEqual(posts[0].rank, posts[1].rank)
+        self.assertContains(response, '&lt;b&gt;<mark>Котики</mark>')
+
+    def test_search_without_words_finds_nothing(self):
+        """Запрос без слов показывает пустую выдачу, а не ошибку"""
+        for query in ('"', '!', '#@'):
+            response = self.guest_client.get(
+                reverse('posts:post_search'), {'q': query}
+            )
+            self.assertContains(response, 'Ничего не найдено.')
+
+    def test_search_paginates_by_rank_cursor(self):
+        """Результаты поиска листаются курсором с сохранением запроса"""
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Поиск номер {i}')
+            for i in range(LAST_POST_COUNT_13)
+        )
+        url = reverse('posts:post_search')
+        response = self.guest_client.get(url, {'q': 'поиск'})
+        first = list(response.context['page_obj'])
+        cursor = response.context['page_obj'].paginator.next_cursor
+        self.assertContains(response, 'q=%D0%BF%D0%BE%D0%B8%D1%81%D0%BA')
+        response = self.guest_client.get(url, {'q': 'поиск', 'after': cursor})
+        second = list(response.context['page_obj'])
+        self.assertEqual(len(first), POST_AMOUNT_10)
+        self.assertEqual(len(second), POST_AMOUNT_3)
+        self.assertFalse({post.id for post in first}
+                         & {post.id for post in second})
+
+    def test_search_index_follows_bulk_writes(self):
+        """Индекс поиска обновляется и при записи в обход модели, и
+        восстанавливается, если триггеры пропали"""
+        url = reverse('posts:post_search')
+        Post.objects.filter(pk=self.post.pk).update(text='Новый заголовок')
+        response = self.guest_client.get(url, {'q': 'заголовок'})
+        self.assertEqual(len(response.context['page_obj']), 1)
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER posts_post_fts_update')
+        Post.objects.filter(pk=self.post.pk).update(text='Другой текст')
+        ensure_search_indexes(connection)
+        response = self.guest_client.get(url, {'q': 'заголовок'})
+        self.assertEqual(len(response.context['page_obj']), 0)
+        response = self.guest_client.get(url, {'q': 'другой'})
+        self.assertEqual(len(response.context['page_obj']), 1)
+
+    def test_unchanged_feeds_answer_not_modified(self):
+        """Неизменившиеся ленты и пост в API отвечают 304 без запросов
+        к постам и без шаблонов, а запись в ленту меняет валидаторы"""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+            f'/api/v1/posts/{self.post.id}/',
+        )
+        for url in urls:
+            response = self.authorized_client.get(url)
+            etag = response['ETag']
+            with CaptureQueriesContext(connection) as queries:
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag
+                )
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response['ETag'], etag)
+            self.assertFalse(response.templates)
+            self.assertFalse([
+                query for query in queries.captured_queries
+                if 'posts_post' in query['sql']
+            ], url)
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+
+        url = urls[1]
+        response = self.guest_client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        response = self.guest_client.get(
+            url, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 304)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Новый текст'
+        post.save()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        url = urls[2]
+        etag = self.guest_client.get(url)['ETag']
+        Follow.objects.create(user=self.following, author=self.user)
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        # Название группы видно на главной и в профилях её авторов, а
+        # после удаления группы меняются и сами посты в API.
+        for change, changed in (('rename', (urls[0], urls[2])),
+                                ('delete', (urls[0], urls[2], urls[3]))):
+            etags = {url: self.guest_client.get(url)['ETag']
+                     for url in changed}
+            group = Group.objects.get(pk=self.group.pk)
+            if change == 'rename':
+                group.title = 'Новое название'
+                group.save()
+            else:
+                group.delete()
+            for url, etag in etags.items():
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 200, (change, url))
+
+    def test_tags_and_mentions_are_extracted_on_save(self):
+        """Хештеги и упоминания извлекаются при сохранении и обновляются
+        при правке текста"""
+        post = Post.objects.create(
+            author=self.following,
+            text='#Котики и #собаки, привет @auth и @nobody',
+        )
+        self.assertEqual(
+            set(post.post_tags.values_list('tag__name', flat=True)),
+            {'котики', 'собаки'},
+        )
+        self.assertEqual(
+            list(self.user.mentions.values_list('post', 'comment')),
+            [(post.id, None)],
+        )
+        post.text = 'Только #котики'
+        post.save()
+        self.assertEqual(
+            list(post.post_tags.values_list('tag__name', flat=True)),
+            ['котики'],
+        )
+        self.assertFalse(self.user.mentions.exists())
+        comment = Comment.objects.create(
+            post=post, author=self.following, text='@auth, посмотри'
+        )
+        self.assertEqual(
+            list(self.user.mentions.values_list('comment', flat=True)),
+            [comment.id],
+        )
+
+    def test_tag_page_lists_tagged_posts(self):
+        """Страница тега выводит посты с тегом, а текст карточек
+        превращает теги и упоминания в ссылки"""
+        tagged = Post.objects.create(
+            author=self.user,
+            text=(
+                'Про #Котиков <script> для @Author, но не &#собак, '
+                '@nobody и @...'
+            ),
+        )
+        Post.objects.create(author=self.user, text='Без тегов')
+        url = reverse('posts:tag_posts', args=('котиков',))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(url)
+        self.assertEqual(list(response.context['page_obj']), [tagged])
+        self.assertContains(response, f'<a href="{url}">#Котиков</a>')
+        self.assertContains(response, '&lt;script&gt;')
+        self.assertContains(response, '&amp;#собак')
+        self.assertNotContains(
+            response, reverse('posts:tag_posts', args=('собак',))
+        )
+        self.assertContains(
+            response,
+            '<a href="{}">@Author</a>'.format(
+                reverse('posts:profile', args=('Author',))
+            ),
+        )
+        self.assertContains(response, '@nobody и @...')
+        self.assertNotContains(
+            response, reverse('posts:profile', args=('nobody',))
+        )
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if 'LIKE' in query['sql']
+        ])
+
+    def test_mention_without_name_is_plain_text(self):
+        """«@» без буквы после него — не упоминание: ленты не падают,
+        а пустое имя не извлекается"""
+        post = Post.objects.create(author=self.user, text='see @... here @.')
+        self.assertEqual(extract_mentions(post.text), [])
+        for url in (
+            reverse('posts:index'),
+            reverse('posts:post_detail', args=(post.id,)),
+        ):
+            response = self.guest_client.get(url)
+            self.assertContains(response, 'see @... here @.')
+
+
+class AdminTests(PostsTestCase):
+    def test_admin_search_uses_full_text_index(self):
+        """Поиск в админке идёт по индексу, а не по LIKE"""
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.authorized_client.force_login(admin)
+        for text in ('Отличный комментарий', 'Тоже отличный'):
+            Comment.objects.create(post=self.post, author=self.user, text=text)
+        Post.objects.create(author=self.user, text='Тоже находится')
+        for url, query in (('admin:posts_post_changelist', 'находится'),
+                           ('admin:posts_comment_changelist', 'отличн')):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.authorized_client.get(
+                    reverse(url), {'q': query}
+                )
+            self.assertEqual(response.context['cl'].result_count, 2)
+            sql = ' '.join(query['sql'] for query in queries.captured_queries)
+            self.assertIn('MATCH', sql)
+            self.assertNotIn('LIKE', sql)
+
+    def test_admin_changelists_do_not_grow_with_rows(self):
+        """Списки админки не делают запросов на строку и точных COUNT(*)
+        по всей таблице"""
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.authorized_client.force_login(admin)
+        urls = ('admin:posts_post_changelist',
+                'admin:posts_comment_changelist',
+                'admin:posts_follow_changelist')
+
+        def captured(url, data=None):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.authorized_client.get(reverse(url), data)
+            self.assertEqual(response.status_code, 200)
+            return [query['sql'] for query in queries.captured_queries]
+
+        counts = [len(captured(url)) for url in urls]
+        for number in range(5):
+            author = User.objects.create_user(f'admin_author_{number}')
+            post = Post.objects.create(
+                author=author, group=self.group, text=f'Пост {number}'
+            )
+            Comment.objects.create(post=post, author=author, text='Ответ')
+            Follow.objects.create(user=self.user, author=author)
+        for url, count in zip(urls, counts):
+            queries = captured(url)
+            self.assertEqual(len(queries), count)
+            self.assertFalse(
+                [sql for sql in queries if 'COUNT(*)' in sql], url
+            )
+        queries = captured(
+            urls[0], {'pub_date__gte': '2000-01-01 00:00:00+00:00'}
+        )
+        self.assertTrue([sql for sql in queries if 'LIMIT 10000' in sql])
+
+    def test_admin_paginator_pages_past_estimate(self):
+        """Оценка числа записей не обрезает страницы списка, а номер
+        страницы за последней записью открывает последнюю страницу"""
+        posts = [
+            Post.objects.create(author=self.following, text=f'Пост {number}')
+            for number in range(5)
+        ]
+        filtered = Post.objects.filter(author=self.following).order_by('id')
+        with patch.object(EstimatedCountPaginator, 'COUNT_LIMIT', 2):
+            paginator = EstimatedCountPaginator(filtered, 2)
+            self.assertEqual(paginator.count, 2)
+            self.assertTrue(paginator.approximate)
+            page = paginator.page(3)
+        self.assertEqual(list(page), posts[4:])
+        self.assertFalse(page.has_next())
+        self.assertEqual(paginator.count, 5)
+
+        Post.objects.filter(pk__in=[post.pk for post in posts[:4]]).delete()
+        paginator = EstimatedCountPaginator(Post.objects.order_by('id'), 1)
+        self.assertEqual(paginator.count, posts[4].pk)
+        page = paginator.page(paginator.num_pages)
+        self.assertEqual((page.number, list(page)), (2, posts[4:]))
+        self.assertEqual(paginator.num_pages, 2)
+
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.authorized_client.force_login(admin)
+        response = self.authorized_client.get(
+            reverse('admin:posts_post_changelist'), {'p': 50}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '≈')
+
+    def test_admin_exports_selected_posts_as_csv_stream(self):
+        """Выбранные посты выгружаются в CSV потоком"""
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.authorized_client.force_login(admin)
+        response = self.authorized_client.post(
+            reverse('admin:posts_post_changelist'),
+            {'action': 'export_csv', 'index': 0,
+             ACTION_CHECKBOX_NAME: [self.post.pk]},
+        )
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(
+            b''.join(response.streaming_content).decode().splitlines()
+        ))
+        self.assertEqual(rows[0][:3], ['pk', 'pub_date', 'author__username'])
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][2:5], ['auth', 'first_slug', self.post.text])
+
+
+class AdminJobTests(PostsTestCase):
+    @override_settings(ADMIN_JOB_BATCH_SIZE=2)
+    def test_admin_jobs_reassign_group_and_purge_user(self):
+        """Перенос в группу и удаление контента пользователя идут
+        фоновыми заданиями пачками и сохраняют счётчики"""
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.authorized_client.force_login(admin)
+        other = Group.objects.create(title='Другая', slug='other_slug')
+        posts = [
+            Post.objects.create(author=self.following, text=f'Пост {number}')
+            for number in range(3)
+        ]
+        Comment.objects.create(
+            post=self.post, author=self.following, text='Комментарий'
+        )
+        ids = [str(post.pk) for post in posts]
+        url = reverse('admin:posts_post_changelist')
+        data = {'action': 'reassign_group', 'index': 0,
+                ACTION_CHECKBOX_NAME: ids}
+        response = self.authorized_client.post(url, data)
+        self.assertTemplateUsed(response, 'admin/posts/confirm_job.html')
+        self.assertFalse(AdminJob.objects.exists())
+        self.authorized_client.post(
+            url, {**data, 'apply': 1, 'group': other.pk}
+        )
+        job = AdminJob.objects.get()
+        self.assertEqual((job.status, job.total), (AdminJob.QUEUED, 3))
+        self.assertTrue(run_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), (AdminJob.DONE, 3))
+        self.assertEqual(other.group.count(), 3)
+        other.refresh_from_db()
+        self.assertEqual(other.posts_count, 3)
+
+        self.authorized_client.post(
+            reverse('admin:auth_user_changelist'),
+            {'action': 'purge_content', 'index': 0, 'apply': 1,
+             ACTION_CHECKBOX_NAME: [self.following.pk]},
+        )
+        job = AdminJob.objects.filter(action='purge_user_content').get()
+        self.assertEqual(job.total, 4)
+        self.assertTrue(run_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), (AdminJob.DONE, 4))
+        self.assertFalse(self.following.posts.exists())
+        self.assertFalse(self.following.comments.exists())
+        other.refresh_from_db()
+        self.post.refresh_from_db()
+        self.assertEqual(other.posts_count, 0)
+        self.assertEqual(self.post.comments_count, 0)
+
+    @override_settings(ADMIN_JOB_BATCH_SIZE=2)
+    def test_admin_job_for_all_rows_stores_filters_and_recovers(self):
+        """«Выбрать все» передаёт заданию фильтры списка, а не id
+        записей, а задание, брошенное остановленным процессом,
+        выполняет recover_admin_jobs"""
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.authorized_client.force_login(admin)
+        other = Group.objects.create(title='Другая', slug='other_slug')
+        posts = [
+            Post.objects.create(author=self.following, text=f'Котик {number}')
+            for number in range(3)
+        ]
+        self.authorized_client.post(
+            reverse('admin:posts_post_changelist') + '?q=котик',
+            {'action': 'reassign_group', 'index': 0, 'select_across': 1,
+             ACTION_CHECKBOX_NAME: [posts[0].pk], 'apply': 1,
+             'group': other.pk},
+        )
+        job = AdminJob.objects.get()
+        arguments = json.loads(job.arguments)
+        self.assertNotIn('ids', arguments)
+        self.assertEqual(
+            (arguments['search'], arguments['last_id']),
+            ('котик', posts[-1].pk),
+        )
+        self.assertEqual(job.total, 3)
+        Post.objects.create(author=self.following, text='Котик позже')
+        AdminJob.objects.filter(pk=job.pk).update(
+            status=AdminJob.RUNNING,
+            heartbeat=timezone.now() - timedelta(hours=1),
+        )
+        call_command('recover_admin_jobs', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), (AdminJob.DONE, 3))
+        self.assertEqual(set(other.group.all()), set(posts))
+        self.assertFalse(run_job(job.pk))
+
+
+class ApiTests(PostsTestCase):
+    @override_settings(API_PAGE_SIZE=2)
+    def test_api_lists_posts_with_filters_and_cursors(self):
+        """Список постов API фильтруется, листается курсорами и отдаёт
+        только запрошенные поля"""
+        for number in range(3):
+            Post.objects.create(author=self.following, text=f'Пост {number}')
+        url = reverse('posts:api_posts')
+        response = self.guest_client.get(url, {'author': 'Author'})
+        data = response.json()
+        self.assertEqual(
+            [post['text'] for post in data['results']], ['Пост 2', 'Пост 1']
+        )
+        self.assertIsNone(data['previous'])
+        data = self.guest_client.get(data['next']).json()
+        self.assertEqual(
+            [post['text'] for post in data['results']], ['Пост 0']
+        )
+        self.assertIsNone(data['next'])
+        self.assertIn('author=Author', data['previous'])
+        data = self.guest_client.get(
+            url, {'group': self.group.slug, 'fields': 'id,author'}
+        ).json()
+        self.assertEqual(
+            data['results'], [{'id': self.post.id, 'author': self.user.id}]
+        )
+        response = self.guest_client.get(url, {'fields': 'password'})
+        self.assertEqual(response.status_code, 400)
+        for values in MALFORMED_CURSORS:
+            for direction in ('after', 'before'):
+                with self.subTest(values=values, direction=direction):
+                    response = self.guest_client.get(
+                        url, {direction: make_cursor(values)}
+                    )
+                    self.assertEqual(response.status_code, 400)
+
+    def test_api_multi_get_reads_posts_in_one_query(self):
+        """?ids= возвращает посты в порядке запроса одним запросом"""
+        other = Post.objects.create(author=self.following, text='Другой')
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(
+                reverse('posts:api_posts'),
+                {'ids': f'{other.id},0,{self.post.id},{other.id}'},
+            )
+        data = response.json()
+        self.assertEqual(
+            [post['id'] for post in data['results']],
+            [other.id, self.post.id],
+        )
+        self.assertEqual(data['results'][1]['group'], self.group.id)
+        self.assertEqual(data['not_found'], [0])
+        response = self.guest_client.get(
+            reverse('posts:api_posts'), {'ids': '1,x'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_missing_post_leaves_no_cache_keys(self):
+        """Запрос несуществующего поста отвечает 404 и не заводит в кеше
+        поколение и время записи"""
+        missing = Post.objects.order_by('-pk').first().pk + 1000
+        response = self.guest_client.get(f'/api/v1/posts/{missing}/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(cache.get_many([
+            GENERATION_KEY.format(f'post:{missing}'),
+            MODIFIED_KEY.format(f'post:{missing}'),
+        ]), {})
+
+    def test_values_serializer_matches_drf(self):
+        """Быстрый путь через values() отдаёт то же, что PostSerializer"""
+        Post.objects.create(author=self.following, text='Без группы')
+        posts = Post.objects.order_by('id')
+        for fields in (PostSerializer.Meta.fields, ('pub_date', 'group')):
+            self.assertEqual(
+                represent_posts(post_values(posts, fields), fields),
+                [dict(post) for post in PostSerializer(
+                    posts, many=True, fields=fields
+                ).data],
+            )
+        response = self.guest_client.get(f'/api/v1/posts/{self.post.id}/')
+        self.assertEqual(response.json(), PostSerializer(self.post).data)
+
+
+class ExportTests(PostsTestCase):
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_export_streams_ndjson(self):
+        """Выгрузка отдаёт NDJSON потоком по куску на пачку и доступна
+        только персоналу"""
+        for number in range(2):
+            Post.objects.create(author=self.following, text=f'Пост {number}')
+        Comment.objects.create(
+            post=self.post, author=self.following, text='Комментарий'
+        )
+        url = reverse('posts:api_export', kwargs={'kind': 'posts'})
+        response = self.authorized_client.get(url)
+        self.assertEqual(response.status_code, 302)
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.authorized_client.force_login(admin)
+        response = self.authorized_client.get(url)
+        self.assertEqual(response['Content-Type'],
+                         'application/x-ndjson; charset=utf-8')
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 2)
+        rows = [json.loads(line) for line in b''.join(chunks).splitlines()]
+        self.assertEqual(
+            rows, [dict(post) for post in PostSerializer(
+                Post.objects.order_by('id'), many=True
+            ).data],
+        )
+        response = self.authorized_client.get(
+            reverse('posts:api_export', kwargs={'kind': 'comments'}),
+            {'group': self.group.slug},
+        )
+        rows = [json.loads(line) for line in b''.join(
+            response.streaming_content
+        ).splitlines()]
+        self.assertEqual(
+            [(row['post'], row['text']) for row in rows],
+            [(self.post.id, 'Комментарий')],
+        )
+        output = StringIO()
+        call_command('export_ndjson', 'posts', author='Author', stdout=output)
+        self.assertEqual(
+            [json.loads(line)['text']
+             for line in output.getvalue().splitlines()],
+            ['Пост 0', 'Пост 1'],
+        )
@@ -0,0 +1,216 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.helpers import toint
+from sorl.thumbnail.images import ImageFile
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_render_executor = None
+
+
+class PlannedThumbnailBackend(ThumbnailBackend):
+    """Вычисляет файл миниатюры так же, как get_thumbnail, но не
+    обращается ни к kvstore, ни к исходной картинке."""
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        source = ImageFile(image_source(file_))
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+
+planned_backend = PlannedThumbnailBackend()
+
+
+def scale_geometry(geometry, width):
+    """Уменьшает геометрию вида 960x339 до ширины width с сохранением
+    пропорций."""
+    base_width, base_height = map(int, geometry.split('x'))
+    return f'{width}x{round(base_height * width / base_width)}'
+
+
+def thumbnail_formats():
+    """Форматы POST_THUMBNAIL_FORMATS, которые умеет записывать Pillow."""
+    Image.init()
+    return [name for name in settings.POST_THUMBNAIL_FORMATS
+            if name in Image.SAVE]
+
+
+def thumbnail_variants(name):
+    """Возвращает варианты миниатюры name из POST_THUMBNAILS: формат,
+    ширину, геометрию и параметры sorl. Последний вариант — самый
+    широкий в запасном формате."""
+    geometry, options = settings.POST_THUMBNAILS[name]
+    base_width = int(geometry.split('x')[0])
+    widths = sorted({
+        width for width in settings.POST_THUMBNAIL_WIDTHS
+        if width < base_width
+    } | {base_width})
+    return [
+        (image_format, width, scale_geometry(geometry, width),
+         {**options, 'format': image_format})
+        for image_format in thumbnail_formats()
+        for width in widths
+    ]
+
+
+def thumbnail_size(post, name):
+    """Ширина и высота самой широкой миниатюры name, посчитанные, как
+    это делает sorl, по сохранённым размерам картинки поста; None, если
+    размеры неизвестны."""
+    if not post.image_width or not post.image_height:
+        return None
+    geometry, options = settings.POST_THUMBNAILS[name]
+    box_width, box_height = map(int, geometry.split('x'))
+    width, height = post.image_width, post.image_height
+    fit = max if options.get('crop') else min
+    factor = fit(box_width / width, box_height / height)
+    if factor > 1 and not options.get('upscale'):
+        factor = 1
+    width, height = toint(width * factor), toint(height * factor)
+    if options.get('crop'):
+        width, height = min(width, box_width), min(height, box_height)
+    return width, height
+
+
+def image_source(image):
+    """Возвращает исходную картинку поста для sorl. Имя файла
+    связывается с хранилищем поля Post.image: от хранилища зависят ключи
+    и имена миниатюр."""
+    if isinstance(image, str):
+        return ImageFile(image, Post._meta.get_field('image').storage)
+    return image
+
+
+def generate_thumbnails(image):
+    """Создаёт все варианты миниатюр POST_THUMBNAILS для картинки поста.
+
+    Уже созданные миниатюры sorl находит в kvstore и не пересчитывает.
+    """
+    image = image_source(image)
+    return {
+        (name, image_format, width): get_thumbnail(image, geometry, **options)
+        for name in settings.POST_THUMBNAILS
+        for image_format, width, geometry, options in thumbnail_variants(name)
+    }
+
+
+def generate_thumbnails_safely(image):
+    try:
+        generate_thumbnails(image)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', image)
+        return False
+    return True
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def enqueue_thumbnails(post):
+    """Ставит создание миниатюр картинки поста в фоновую очередь
+    процесса после фиксации транзакции."""
+    if not post.image:
+        return
+    image = post.image.name
+    if settings.THUMBNAIL_WORKERS:
+        transaction.on_commit(
+            lambda: get_executor().submit(generate_thumbnails_safely, image)
+        )
+    else:
+        transaction.on_commit(lambda: generate_thumbnails_safely(image))
+
+
+def get_render_executor():
+    global _render_executor
+    if _render_executor is None:
+        _render_executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_RENDER_WORKERS,
+            thread_name_prefix='thumbnails-render',
+        )
+    return _render_executor
+
+
+def lookup_thumbnails(files):
+    """Ищет файлы миниатюр в kvstore, по возможности одним запросом."""
+    get_many = getattr(default.kvstore, 'get_many', None)
+    if get_many is not None:
+        return get_many(files)
+    found = (default.kvstore.get(image_file) for image_file in files)
+    return {image_file.key: image_file for image_file in found if image_file}
+
+
+def resolve_thumbnails(posts, name):
+    """Сохраняет в post.thumbnail самую широкую миниатюру name из
+    POST_THUMBNAILS в запасном формате, в post.thumbnail_srcsets —
+    значения srcset для каждого формата, а в post.thumbnail_size — её
+    размеры для атрибутов width и height.
+
+    Все варианты миниатюр страницы находятся одним запросом к kvstore,
+    недостающие создаются параллельно в пуле потоков, так что шаблону
+    остаётся только вывести адреса.
+    """
+    variants = thumbnail_variants(name)
+    planned = {}
+    for post in posts:
+        post.thumbnail = None
+        post.thumbnail_srcsets = {}
+        post.thumbnail_size = thumbnail_size(post, name)
+        if post.image:
+            for image_format, width, geometry, options in variants:
+                image_file = planned_backend.thumbnail_file(
+                    post.image, geometry, **options
+                )
+                planned[post, image_format, width] = (
+                    image_file, post.image, geometry, options
+                )
+    found = lookup_thumbnails([plan[0] for plan in planned.values()])
+    missing = [plan for plan in planned.values() if plan[0].key not in found]
+
+    def generate(plan):
+        _, source, geometry, options = plan
+        return get_thumbnail(source, geometry, **options)
+
+    if len(missing) > 1 and settings.THUMBNAIL_RENDER_WORKERS:
+        generated = get_render_executor().map(generate, missing)
+    else:
+        generated = map(generate, missing)
+    for plan, thumbnail in zip(missing, generated):
+        found[plan[0].key] = thumbnail
+    srcsets = {}
+    for (post, image_format, width), plan in planned.items():
+        thumbnail = found[plan[0].key]
+        if thumbnail.size:
+            width = thumbnail.width
+        srcsets.setdefault((post, image_format.lower()), []).append(
+            f'{thumbnail.url} {width}w'
+        )
+        post.thumbnail = thumbnail
+    for (post, image_format), srcset in srcsets.items():
+        post.thumbnail_srcsets[image_format] = ', '.join(srcset)
+    return posts
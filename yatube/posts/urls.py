@@ -7,9 +7,16 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path('tags/<str:name>/', views.tag_posts, name='tag_posts'),
+    path('search/', views.post_search, name='post_search'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path(
         'posts/<int:post_id>/comment/',
         views.add_comment,
@@ -26,5 +33,11 @@ urlpatterns = [
         views.profile_unfollow,
         name='profile_unfollow'
     ),
+    path('api/v1/posts/', views.get_posts, name='api_posts'),
     path('api/v1/posts/<int:pk>/', views.get_post),
+    path(
+        'api/v1/export/<str:kind>/',
+        views.export_posts,
+        name='api_export'
+    ),
 ]
@@ -1,20 +1,62 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.models import User
-from .models import Post, Group, Comment, Follow
+from .models import Post, Group, Follow, Tag
+from .conditional import feed_condition
+from .counters import get_user_counter
+from .export import EXPORTS, export_ndjson
+from .feeds import MergedFeedPaginator
 from .forms import PostForm, CommentForm
-from .serializers import PostSerializer
-from django.http import JsonResponse
+from .generations import feed_cache, has_generation
+from .paginators import CursorPaginator
+from .search import highlight, match_expression, search
+from .serializers import PostSerializer, post_values, represent_posts
+from .thumbnails import enqueue_thumbnails, resolve_thumbnails
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 
 
-def paginator(request, posts, select_limit):
-    paginator = Paginator(posts, select_limit)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+COMMENTS_PER_PAGE = 20
 
 
+def get_page(request, paginator):
+    return paginator.cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+
+
+def paginator(request, posts, select_limit, **kwargs):
+    return get_page(request, CursorPaginator(posts, select_limit, **kwargs))
+
+
+def group_scope(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'id', flat=True
+    ).first()
+    return group_id and f'group:{group_id}'
+
+
+def author_scope(request, username):
+    user_id = User.objects.filter(username=username).values_list(
+        'id', flat=True
+    ).first()
+    return user_id and f'author:{user_id}'
+
+
+def post_scope(request, pk):
+    """Поколение заводится только для существующего поста: иначе
+    перебор случайных id навсегда оставлял бы в кеше ключи. Пока
+    поколение есть, пост не проверяется."""
+    scope = f'post:{pk}'
+    if has_generation(scope) or Post.objects.filter(pk=pk).exists():
+        return scope
+    return None
+
+
+@feed_condition(lambda request: 'index')
 def index(request):
     post_list = Post.objects.all().select_related('author', 'group')
     page_obj = paginator(request, post_list, 10)
@@ -22,10 +64,12 @@ def index(request):
     context = {
         'title': title,
         'page_obj': page_obj,
+        **feed_cache('index'),
     }
     return render(request, 'posts/index.html', context)
 
 
+@feed_condition(group_scope)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
     post_list = group.group.all().select_related('author')
@@ -36,16 +80,19 @@ def group_posts(request, slug):
         'group': group,
         'page_obj': page_obj,
         'title': title,
+        **feed_cache(f'group:{group.id}'),
     }
     return render(request, template, context)
 
 
+@feed_condition(author_scope)
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
+    user = get_object_or_404(
+        User.objects.select_related('counters'), username=username
+    )
     posts = user.posts.all().select_related('group')
     page_obj = paginator(request, posts, 10)
-    count = posts.count()
-    follower_counts = Follow.objects.filter(author=user).count()
+    counter = get_user_counter(user)
     flag = user != request.user
     if request.user.is_authenticated:
         following = Follow.objects.filter(
@@ -57,21 +104,61 @@ def profile(request, username):
     context = {
         'author': user,
         'username': username,
-        'count': count,
+        'count': counter.posts_count,
         'page_obj': page_obj,
         'following': following,
         'not_the_current_user': flag,
-        'follower_counts': follower_counts,
+        'follower_counts': counter.followers_count,
+        'following_counts': counter.following_count,
+        **feed_cache(f'author:{user.id}'),
     }
     return render(request, 'posts/profile.html', context)
 
 
+def tag_posts(request, name):
+    tag = get_object_or_404(Tag, name=name.lower())
+    entries = tag.post_tags.select_related('post__author', 'post__group')
+    page_obj = paginator(
+        request, entries, 10, ordering=('-pub_date', '-post_id')
+    )
+    page_obj.object_list = [entry.post for entry in page_obj]
+    context = {
+        'title': f'Записи с тегом {tag}',
+        'tag': tag,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/tag_posts.html', context)
+
+
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    # В запросе без слов искать нечего: выдача просто пустая.
+    if match_expression(query):
+        posts = search(
+            Post.objects.select_related('author', 'group'),
+            'posts_post_fts',
+            query,
+        )
+        page_obj = paginator(request, posts, 10, ordering=('rank', 'id'))
+        for post in page_obj:
+            post.snippet_html = highlight(post.snippet)
+    context = {
+        'title': f'Поиск: {query}' if query else 'Поиск',
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    posts = Post.objects.filter(author=post.author)
-    count = posts.count()
+    post = get_object_or_404(
+        Post.objects.select_related('author__counters', 'group'), id=post_id
+    )
+    resolve_thumbnails([post], 'detail')
+    count = get_user_counter(post.author).posts_count
     form = CommentForm(request.POST or None)
-    comments = Comment.objects.filter(post=post)
+    comments = paginate_comments(request, post)
     context = {
         'post_id': post_id,
         'post': post,
@@ -82,6 +169,22 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+def paginate_comments(request, post):
+    comments = post.comments.select_related('author')
+    return get_page(request, CursorPaginator(
+        comments, COMMENTS_PER_PAGE, ordering=('created', 'id')
+    ))
+
+
+def post_comments(request, post_id):
+    post = get_object_or_404(Post.objects.only('id'), id=post_id)
+    context = {
+        'post': post,
+        'comments': paginate_comments(request, post),
+    }
+    return render(request, 'includes/comments.html', context)
+
+
 @login_required
 def post_create(request):
 
@@ -94,6 +197,7 @@ def post_create(request):
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            enqueue_thumbnails(post)
             return redirect('posts:profile', username=request.user.username)
     else:
         form = PostForm()
@@ -119,6 +223,8 @@ def post_edit(request, post_id):
     )
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            enqueue_thumbnails(post)
         return redirect('posts:post_detail', post_id=post_id)
 
     title = 'Редактирование поста'
@@ -144,10 +250,17 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(
-        author__following__user=request.user
-    ).select_related('author', 'group')
-    page_obj = paginator(request, posts, 10)
+    if settings.FOLLOW_FEED_ENGINE == 'pull':
+        author_ids = request.user.follower.values_list('author_id', flat=True)
+        page_obj = get_page(request, MergedFeedPaginator(author_ids, 10))
+    else:
+        entries = request.user.feed_entries.select_related(
+            'post__author', 'post__group'
+        )
+        page_obj = paginator(
+            request, entries, 10, ordering=('-pub_date', '-post_id')
+        )
+        page_obj.object_list = [entry.post for entry in page_obj]
 
     context = {
         'title': 'Подписки на авторов',
@@ -174,8 +287,127 @@ def profile_unfollow(request, username):
     return redirect('posts:profile', username=username)
 
 
+@feed_condition(post_scope)
 def get_post(request, pk):
     if request.method == 'GET':
-        post = get_object_or_404(Post, id=pk)
-        serializer = PostSerializer(post)
-        return JsonResponse(serializer.data)
+        post = get_object_or_404(post_values(Post.objects.all()), id=pk)
+        return JsonResponse(represent_posts([post])[0])
+
+
+def api_error(message):
+    return JsonResponse({'detail': message}, status=400)
+
+
+def api_fields(request):
+    """Поля из ?fields=, без него — все поля PostSerializer; None,
+    если запрошено неизвестное поле."""
+    fields = PostSerializer.Meta.fields
+    if 'fields' not in request.GET:
+        return fields
+    requested = [name for name in request.GET['fields'].split(',') if name]
+    if not requested or not set(requested) <= set(fields):
+        return None
+    return requested
+
+
+def api_ids(value):
+    """Разбирает список id через запятую без повторов; None, если
+    в нём есть не число."""
+    try:
+        return list(dict.fromkeys(int(pk) for pk in value.split(',') if pk))
+    except ValueError:
+        return None
+
+
+def api_broken_cursor(request, cursors):
+    """Имя параметра с повреждённым курсором: HTML-ленты молча
+    открывают первую страницу, а API сообщает об ошибке."""
+    for name in ('after', 'before'):
+        value = request.GET.get(name)
+        if value and cursors.decode_cursor(value) is None:
+            return name
+    return None
+
+
+def api_page_url(request, **cursor):
+    query = request.GET.copy()
+    query.pop('after', None)
+    query.pop('before', None)
+    query.update(cursor)
+    return request.build_absolute_uri(f'?{query.urlencode()}')
+
+
+@require_GET
+def get_posts(request):
+    """Посты с фильтрами ?group= (slug) и ?author= (username),
+    курсорами ?after= и ?before= и выбором полей ?fields=.
+
+    ?ids=1,2,3 вместо страницы возвращает посты с этими id в том же
+    порядке, читая их одним запросом; ненайденные id перечисляются
+    в not_found.
+    """
+    fields = api_fields(request)
+    if fields is None:
+        return api_error('Неизвестное поле в fields.')
+    posts = post_values(Post.objects.all(), fields)
+    if 'group' in request.GET:
+        posts = posts.filter(group__slug=request.GET['group'])
+    if 'author' in request.GET:
+        posts = posts.filter(author__username=request.GET['author'])
+
+    if 'ids' in request.GET:
+        ids = api_ids(request.GET['ids'])
+        if ids is None or len(ids) > settings.API_MAX_PAGE_SIZE:
+            return api_error(
+                f'ids — до {settings.API_MAX_PAGE_SIZE} чисел через запятую.'
+            )
+        found = {post['id']: post for post in posts.filter(id__in=ids)}
+        return JsonResponse({
+            'results': represent_posts(
+                [found[pk] for pk in ids if pk in found], fields
+            ),
+            'not_found': [pk for pk in ids if pk not in found],
+        })
+
+    try:
+        limit = int(request.GET.get('limit', settings.API_PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if not 0 < limit <= settings.API_MAX_PAGE_SIZE:
+        return api_error(
+            f'limit — число от 1 до {settings.API_MAX_PAGE_SIZE}.'
+        )
+    cursors = CursorPaginator(posts, limit)
+    broken = api_broken_cursor(request, cursors)
+    if broken:
+        return api_error(f'Неверный курсор в {broken}.')
+    page_obj = get_page(request, cursors)
+    return JsonResponse({
+        'results': represent_posts(page_obj, fields),
+        'next': cursors.next_cursor and api_page_url(
+            request, after=cursors.next_cursor
+        ),
+        'previous': cursors.previous_cursor and api_page_url(
+            request, before=cursors.previous_cursor
+        ),
+    })
+
+
+@staff_member_required
+@require_GET
+def export_posts(request, kind):
+    """Потоковая выгрузка постов или комментариев в NDJSON с фильтрами
+    ?group= (slug) и ?author= (username)."""
+    if kind not in EXPORTS:
+        raise Http404
+    response = StreamingHttpResponse(
+        (chunk.encode() for chunk in export_ndjson(
+            kind,
+            settings.EXPORT_CHUNK_SIZE,
+            group=request.GET.get('group'),
+            author=request.GET.get('author'),
+        )),
+        content_type='application/x-ndjson; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{kind}.ndjson"'
+    return response
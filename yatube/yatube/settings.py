@@ -145,12 +145,93 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Общий для всех процессов сервера кеш в файле SQLite с вытеснением
+# давно не читавшихся записей при превышении MAX_SIZE байт.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backends.sqlite.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_SIZE': 256 * 1024 * 1024,
+        },
     }
 }
 
+# Тесты работают с копией кеша во временном каталоге.
+TEST_RUNNER = 'core.test_runner.TemporaryCacheRunner'
+
+THUMBNAIL_KVSTORE = 'core.cache_backends.thumbnail_kvstore.KVStore'
+THUMBNAIL_CACHE = 'default'
+
+# Миниатюры картинок постов: создаются заранее при загрузке картинки,
+# а шаблоны выводят адреса, найденные resolve_thumbnails.
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+    'detail': ('960x339', {'crop': None, 'upscale': True}),
+}
+# Каждая миниатюра создаётся в нескольких ширинах (не больше исходной
+# геометрии) и форматах для srcset; последний формат — запасной для
+# браузеров, которые не знают остальных.
+POST_THUMBNAIL_WIDTHS = (320, 640, 960)
+POST_THUMBNAIL_FORMATS = ('WEBP', 'JPEG')
+# Число фоновых потоков процесса для создания миниатюр; 0 — создавать
+# сразу при сохранении поста.
+THUMBNAIL_WORKERS = 2
+# Число потоков, которые создают недостающие миниатюры страницы ленты
+# при её отрисовке; 0 — создавать по очереди.
+THUMBNAIL_RENDER_WORKERS = 4
+# Заглушка картинки поста, которая видна до загрузки миниатюры:
+# наибольшая сторона в пикселях и качество JPEG.
+POST_IMAGE_PLACEHOLDER_SIZE = 16
+POST_IMAGE_PLACEHOLDER_QUALITY = 40
+# Загрузка картинок постов: допустимые форматы, предельный размер файла
+# и число пикселей по заголовку. Картинка уменьшается до наибольшей
+# стороны POST_IMAGE_MAX_SIDE и пересохраняется без метаданных.
+POST_IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+POST_IMAGE_MAX_UPLOAD_SIZE = 25 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 100_000_000
+# Предел для форматов, которые Pillow декодирует целиком, без
+# уменьшения при чтении (всё, кроме JPEG): 16 Мп — около 64 МБ RGBA.
+POST_IMAGE_MAX_DECODED_PIXELS = 16_000_000
+POST_IMAGE_MAX_SIDE = 2048
+POST_IMAGE_QUALITY = 85
+
+# Фоновые задания админки: число потоков процесса (0 — выполнять сразу
+# после запроса) и размер пачки, которую задание обрабатывает в одной
+# транзакции.
+ADMIN_JOB_WORKERS = 1
+ADMIN_JOB_BATCH_SIZE = 500
+# Через сколько секунд без новой пачки задание считается брошенным
+# (см. recover_admin_jobs).
+ADMIN_JOB_STALE_AFTER = 60 * 15
+
+# Лента подписок: 'push' раскладывает новые посты по лентам подписчиков
+# при публикации, 'pull' собирает ленту при чтении слиянием закешированных
+# лент авторов. После переключения на 'push' выполните rebuild_follow_feed.
+FOLLOW_FEED_ENGINE = 'push'
+# Размер пачки при раскладке поста и число последних постов автора,
+# добавляемых в ленту при подписке.
+FOLLOW_FEED_BATCH_SIZE = 500
+FOLLOW_FEED_BACKFILL = 1000
+# Сколько последних постов автора и как долго хранится в кеше для 'pull'.
+AUTHOR_TIMELINE_SIZE = 200
+AUTHOR_TIMELINE_TIMEOUT = 60 * 60 * 24
+
+# Срок хранения фрагментов лент. Фрагменты сбрасываются при записи
+# в ленту через счётчики поколений, срок лишь ограничивает память.
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+# Срок хранения отрисованных карточек постов; ключ карточки включает
+# время изменения поста.
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# JSON API: размер страницы списка постов по умолчанию и наибольший
+# размер страницы и число id в одном запросе ?ids=.
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+# Выгрузка в NDJSON: сколько строк читается из базы и отдаётся клиенту
+# за раз.
+EXPORT_CHUNK_SIZE = 2000
+
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index'